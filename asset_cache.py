@@ -0,0 +1,128 @@
+"""In-memory cache for the static game files.
+
+Each asset is read once, kept as bytes alongside gzip (and brotli, when the
+``brotli`` package is installed) compressed copies, and tagged with an ETag and
+Last-Modified time. The file's mtime is rechecked at most once per
+``check_interval`` seconds and the asset is reloaded when it changes.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred order when a client accepts several encodings equally
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+class Asset:
+    __slots__ = ('filename', 'content_type', 'mtime_ns', 'last_modified',
+                 'modified_at', 'etag', 'bodies', 'checked_at')
+
+    def __init__(self, filename, content_type, data, mtime_ns):
+        self.filename = filename
+        self.content_type = content_type
+        self.mtime_ns = mtime_ns
+        self.modified_at = mtime_ns // 1_000_000_000
+        self.last_modified = formatdate(self.modified_at, usegmt=True)
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+        self.bodies = {'identity': data}
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            self.bodies['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                self.bodies['br'] = compressed
+        self.checked_at = time.monotonic()
+
+    def etag_for(self, encoding):
+        """Each encoding is a distinct representation, so it gets its own tag"""
+        if encoding == 'identity':
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{encoding}"'
+
+    def not_modified(self, if_none_match, if_modified_since):
+        """Evaluate conditional request headers against this asset"""
+        if if_none_match is not None:
+            if if_none_match.strip() == '*':
+                return True
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag.strip('"').split('-')[0] == self.etag:
+                    return True
+            return False
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return self.modified_at <= since
+        return False
+
+    def negotiate(self, accept_encoding):
+        """Pick the best available encoding for an Accept-Encoding header"""
+        if not accept_encoding:
+            return 'identity'
+        accepted = {}
+        for part in accept_encoding.split(','):
+            name, _, params = part.strip().partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        wildcard = accepted.get('*', 0.0)
+        best, best_quality = 'identity', 0.0
+        for encoding in ENCODINGS:
+            quality = accepted.get(encoding, wildcard)
+            if encoding in self.bodies and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+
+class AssetCache:
+    """Serve files from memory, reloading them when they change on disk"""
+
+    def __init__(self, root='.', check_interval=1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def preload(self, files):
+        """Load (filename, content_type) pairs ahead of the first request"""
+        for filename, content_type in files:
+            self.get(filename, content_type)
+
+    def get(self, filename, content_type):
+        """Return the cached Asset for filename, raising FileNotFoundError"""
+        asset = self._assets.get(filename)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked_at < self.check_interval:
+            return asset
+        path = os.path.join(self.root, filename)
+        mtime_ns = os.stat(path).st_mtime_ns
+        if asset is not None and asset.mtime_ns == mtime_ns:
+            asset.checked_at = now
+            return asset
+        with self._lock:
+            # Another thread may have reloaded it while we waited
+            asset = self._assets.get(filename)
+            if asset is None or asset.mtime_ns != mtime_ns:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                asset = Asset(filename, content_type, data, mtime_ns)
+                self._assets[filename] = asset
+        return asset
@@ -0,0 +1,196 @@
+"""Monte Carlo balance runner.
+
+Simulates many headless games across a process pool and reports aggregate
+statistics: how long players survive, what kills them, and how many items
+enter and leave the economy. Only running totals are kept, so memory stays
+flat no matter how many games are played.
+
+    python balance_runner.py --games 1000000 --policy survivor --workers 8
+
+Every chunk of games gets its own seed stream derived from --seed and the
+chunk number, so a run is reproducible regardless of worker count.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import game_engine
+
+POLICIES = {
+    'random': game_engine.RandomPolicy,
+    'survivor': game_engine.SurvivorPolicy,
+}
+
+# Events that put items into the player's inventory, and that take them out
+ITEM_SOURCES = ('took_item', 'scavenged', 'found_cache', 'supply_drop', 'creature_defeated')
+ITEM_SINKS = ('used_item', 'creature_fed')
+
+
+def load_policy(name):
+    """Resolve a built-in policy name or a 'module:Class' path"""
+    if name in POLICIES:
+        return POLICIES[name]()
+    module_name, _, class_name = name.partition(':')
+    if not class_name:
+        raise ValueError(f"Unknown policy {name!r}; use one of {sorted(POLICIES)} or module:Class")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class RunStats:
+    """Mergeable running totals over any number of games"""
+
+    def __init__(self):
+        self.games = 0
+        self.days = Counter()
+        self.causes = Counter()
+        self.encounters = Counter()
+        self.items_found = Counter()
+        self.items_used = Counter()
+
+    def observe(self, events):
+        for event in events:
+            kind = event.kind
+            if kind == 'encounter':
+                self.encounters[event.data['encounter']] += 1
+            elif kind in ITEM_SOURCES:
+                data = event.data
+                self.items_found.update(data['items'] if 'items' in data else (data['item'],))
+            elif kind in ITEM_SINKS:
+                self.items_used[event.data['item']] += 1
+
+    def add_game(self, state):
+        self.games += 1
+        self.days[state.day] += 1
+        self.causes[state.cause] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.days.update(other.days)
+        self.causes.update(other.causes)
+        self.encounters.update(other.encounters)
+        self.items_found.update(other.items_found)
+        self.items_used.update(other.items_used)
+
+    def percentile(self, fraction):
+        """Days survived at the given fraction (0-1) of the distribution"""
+        target = fraction * self.games
+        seen = 0
+        for day in sorted(self.days):
+            seen += self.days[day]
+            if seen >= target:
+                return day
+        return 0
+
+    def summary(self):
+        total_days = sum(day * count for day, count in self.days.items())
+        games = self.games or 1
+        return {
+            'games': self.games,
+            'days_survived': {
+                'mean': round(total_days / games, 3),
+                'p50': self.percentile(0.5),
+                'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99),
+                'max': max(self.days, default=0),
+                'histogram': {str(day): self.days[day] for day in sorted(self.days)},
+            },
+            'cause_of_death': {cause: count / games for cause, count in self.causes.most_common()},
+            'encounters_per_game': {name: count / games for name, count in self.encounters.most_common()},
+            'items_found_per_game': {item: count / games for item, count in self.items_found.most_common()},
+            'items_used_per_game': {item: count / games for item, count in self.items_used.most_common()},
+        }
+
+
+def simulate_chunk(policy_name, base_seed, chunk_index, games, max_turns):
+    """Play one chunk of games in a worker process"""
+    policy = load_policy(policy_name)
+    # String seeds are hashed with SHA-512, giving independent streams per chunk
+    seeds = random.Random(f"{base_seed}:{chunk_index}")
+    stats = RunStats()
+    for _ in range(games):
+        state = game_engine.run_game(policy, seed=seeds.getrandbits(64),
+                                     max_turns=max_turns, observer=stats.observe)
+        stats.add_game(state)
+    return stats
+
+
+def run(games, policy='random', workers=None, seed=0, chunk_size=2000, max_turns=10000,
+        progress=None):
+    """Simulate games across a process pool and return the merged RunStats"""
+    workers = workers or os.cpu_count() or 1
+    load_policy(policy)  # fail fast on a bad name
+    chunks = [(index, min(chunk_size, games - start))
+              for index, start in enumerate(range(0, games, chunk_size))]
+    total = RunStats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep only a couple of chunks per worker in flight so results are
+        # merged as they arrive instead of piling up.
+        pending = set()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * 2:
+                index, size = chunks[next_chunk]
+                pending.add(pool.submit(simulate_chunk, policy, seed, index, size, max_turns))
+                next_chunk += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                total.merge(future.result())
+            if progress:
+                progress(total.games, games)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate games to tune wasteland balance")
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--policy', default='random',
+                        help=f"one of {sorted(POLICIES)} or module:Class")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--max-turns', type=int, default=10000,
+                        help="end games still running after this many turns")
+    parser.add_argument('--json', dest='json_path', help="also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r🎲 {done}/{total} games", end='', file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    stats = run(args.games, args.policy, args.workers, args.seed, args.chunk_size,
+                args.max_turns, progress)
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+
+    summary = stats.summary()
+    summary['run'] = {
+        'policy': args.policy,
+        'seed': args.seed,
+        'workers': args.workers or os.cpu_count(),
+        'seconds': round(elapsed, 3),
+        'games_per_second': round(stats.games / elapsed, 1),
+    }
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    days = summary['days_survived']
+    print(f"📊 {stats.games} games in {elapsed:.1f}s ({summary['run']['games_per_second']} games/s)")
+    print(f"⏰ Days survived: mean {days['mean']}, p50 {days['p50']}, "
+          f"p90 {days['p90']}, p99 {days['p99']}, max {days['max']}")
+    for cause, share in summary['cause_of_death'].items():
+        print(f"💀 {cause}: {share:.1%}")
+    for item, per_game in summary['items_found_per_game'].items():
+        used = summary['items_used_per_game'].get(item, 0.0)
+        print(f"🎒 {item}: {per_game:.2f} found, {used:.2f} used per game")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""Vectorized batch simulation of the survival loop.
+
+Instead of stepping one ``GameState`` at a time, ``simulate`` keeps N games as
+a struct of NumPy arrays (health, food, water, radiation, day, bunker and item
+counts) and advances every live game by one turn per iteration with
+vectorized dice rolls. Finished games are folded into the statistics and
+dropped from the arrays, so later turns only touch games still alive.
+
+The rules mirror game_engine exactly, and the built-in policies mirror
+``RandomPolicy`` and ``SurvivorPolicy``, so the outcome distributions match
+the scalar engine (check with ``--compare``). Individual games are not
+reproduced roll-for-roll: the dice are drawn in a different order.
+
+    python batch_sim.py --games 5000000 --policy survivor
+    python batch_sim.py --games 200000 --compare 20000
+
+Requires numpy.
+"""
+import argparse
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import game_engine
+from balance_runner import RunStats
+from inventory import ITEMS, ITEM_IDS as ITEM_INDEX
+
+# Item columns follow the interned item ids
+CANNED, WATER, MED_KIT, RAD_PILLS, GAS_MASK, MEAT = range(len(ITEMS))
+BUNKER_ITEMS = tuple(game_engine.BUNKER_START)
+
+# Encounters the vectorized rules implement
+BATCH_ENCOUNTERS = ('scavenge_location', 'mysterious_sound', 'supply_cache',
+                    'radiation_storm', 'creature_encounter')
+
+# Action codes; quitting is never chosen by the batch policies
+SUPPLIES, WASTELAND, REST, RADIATION = range(4)
+ACTION_NAMES = ('supplies', 'wasteland', 'rest', 'radiation')
+
+# Cause codes, in check_game_over's order of precedence
+ALIVE, INJURIES, STARVATION, RADIATION_DEATH, MAX_TURNS = range(5)
+CAUSE_NAMES = (None, 'injuries', 'starvation', 'radiation', 'max_turns')
+
+
+def _item_vector(items):
+    vector = np.zeros(len(ITEMS), dtype=np.int16)
+    for item in items:
+        vector[ITEM_INDEX[item]] += 1
+    return vector
+
+
+class Batch:
+    """Struct-of-arrays state for a batch of games"""
+
+    def __init__(self, games):
+        # int16 holds every reachable value and halves memory traffic
+        self.health = np.full(games, 100, dtype=np.int16)
+        self.food = np.full(games, 50, dtype=np.int16)
+        self.water = np.full(games, 40, dtype=np.int16)
+        self.radiation = np.zeros(games, dtype=np.int16)
+        self.day = np.ones(games, dtype=np.int16)
+        self.bunker = np.tile(np.array([game_engine.BUNKER_START[item] for item in BUNKER_ITEMS],
+                                       dtype=np.int16), (games, 1))
+        self.items = np.zeros((games, len(ITEMS)), dtype=np.int16)
+        self.alive = np.ones(games, dtype=bool)
+
+    def __len__(self):
+        return len(self.health)
+
+    def keep(self, mask):
+        """Drop every game where mask is False"""
+        for name in ('health', 'food', 'water', 'radiation', 'day', 'bunker', 'items', 'alive'):
+            setattr(self, name, getattr(self, name)[mask])
+
+
+class BatchRandomPolicy:
+    """Vectorized game_engine.RandomPolicy (quitting disabled)"""
+
+    def actions(self, batch, rng):
+        return rng.integers(0, len(ACTION_NAMES), len(batch))
+
+    def take_item(self, bunker, rng):
+        # Uniform over the available bunker items plus 'none'; returns the
+        # bunker column taken, or -1 for 'none'
+        available = bunker > 0
+        options = available.sum(axis=1) + 1
+        pick = (rng.random(len(bunker)) * options).astype(np.int64)
+        rank = np.cumsum(available, axis=1) - 1
+        chosen = available & (rank == pick[:, None])
+        return np.where(chosen.any(axis=1), chosen.argmax(axis=1), -1)
+
+    def yes(self, size, rng, decision):
+        return rng.random(size) < 0.5
+
+    def creature(self, items, rng):
+        return rng.integers(0, len(game_engine.CREATURE_CHOICES), len(items))
+
+
+class BatchSurvivorPolicy:
+    """Vectorized game_engine.SurvivorPolicy"""
+
+    def actions(self, batch, rng):
+        needs_supplies = (batch.bunker.sum(axis=1) > 0) & (batch.items.sum(axis=1) < 2)
+        needs_rest = ((batch.food < 40) | (batch.water < 40) | (batch.health < 60)
+                      | (batch.radiation >= 60))
+        return np.where(needs_supplies, SUPPLIES, np.where(needs_rest, REST, WASTELAND))
+
+    def take_item(self, bunker, rng):
+        # First available item, as the scalar policy takes options[0]
+        return (bunker > 0).argmax(axis=1)
+
+    def yes(self, size, rng, decision):
+        return np.full(size, decision != game_engine.INVESTIGATE)
+
+    def creature(self, items, rng):
+        # offer if carrying canned food, otherwise fight
+        return np.where(items[:, CANNED] > 0, 2, 0)
+
+
+POLICIES = {
+    'random': BatchRandomPolicy,
+    'survivor': BatchSurvivorPolicy,
+}
+
+
+def _randint(rng, low, high, size):
+    """Inclusive bounds, like random.randint"""
+    return rng.integers(low, high + 1, size)
+
+
+class _Simulation:
+    def __init__(self, games, policy, rng, stats):
+        if np is None:
+            raise RuntimeError("batch_sim requires numpy (pip install numpy)")
+        self.batch = Batch(games)
+        self.live = games
+        self.policy = policy
+        self.rng = rng
+        self.stats = stats
+        self.found = np.zeros(len(ITEMS), dtype=np.int64)
+        self.used = np.zeros(len(ITEMS), dtype=np.int64)
+        table = game_engine.TABLES.encounters
+        unsupported = set(table.values) - set(BATCH_ENCOUNTERS)
+        if unsupported:
+            raise ValueError(f"batch mode can't simulate encounters: {sorted(unsupported)}")
+        self.encounter_code = {name: code for code, name in enumerate(table.values)}
+        self.encounter_p = None if table.uniform else np.array(table.probabilities())
+        self.encounters = np.zeros(len(table.values), dtype=np.int64)
+        self.loot = np.array([_item_vector(loot) for loot in game_engine.SCAVENGE_LOOT])
+        self.cache_columns = np.array([ITEM_INDEX[item] for item in game_engine.CACHE_ITEMS])
+
+    def _use_item(self, rows, column):
+        self.batch.items[rows, column] -= 1
+        self.used[column] += len(rows)
+
+    def finish(self, mask, causes):
+        """Record games in mask as finished with the given cause codes"""
+        days = self.batch.day[mask]
+        values, counts = np.unique(days, return_counts=True)
+        for day, count in zip(values.tolist(), counts.tolist()):
+            self.stats.days[day] += count
+        values, counts = np.unique(causes, return_counts=True)
+        for cause, count in zip(values.tolist(), counts.tolist()):
+            self.stats.causes[CAUSE_NAMES[cause]] += count
+        self.stats.games += int(mask.sum())
+
+    def check_game_over(self):
+        b = self.batch
+        cause = np.full(len(b), ALIVE, dtype=np.int8)
+        cause[b.radiation >= 100] = RADIATION_DEATH
+        cause[(b.food <= 0) & (b.water <= 0)] = STARVATION
+        cause[b.health <= 0] = INJURIES
+        dead = (cause != ALIVE) & b.alive
+        if dead.any():
+            self.finish(dead, cause[dead])
+            b.alive &= ~dead
+            self.live -= int(dead.sum())
+            # Compacting copies every array, so only do it once a good share
+            # of the rows are dead; until then dead rows are masked out.
+            if self.live * 4 < len(b) * 3:
+                b.keep(b.alive)
+
+    def turn(self):
+        b = self.batch
+        action = self.policy.actions(b, self.rng)
+        action[~b.alive] = -1
+        self.supplies(np.flatnonzero(action == SUPPLIES))
+        self.wasteland(np.flatnonzero(action == WASTELAND))
+        self.rest(np.flatnonzero(action == REST))
+        # Daily resource drain
+        even = (b.day % 2 == 0) & b.alive
+        b.food[even] = np.maximum(0, b.food[even] - 5)
+        b.water[even] = np.maximum(0, b.water[even] - 8)
+
+    def supplies(self, rows):
+        b = self.batch
+        rows = rows[b.bunker[rows].sum(axis=1) > 0]
+        if not len(rows):
+            return
+        taken = self.policy.take_item(b.bunker[rows], self.rng)
+        took = taken >= 0
+        rows, taken = rows[took], taken[took]
+        b.bunker[rows, taken] -= 1
+        columns = np.array([ITEM_INDEX[item] for item in BUNKER_ITEMS])[taken]
+        b.items[rows, columns] += 1
+        np.add.at(self.found, columns, 1)
+
+    def wasteland(self, rows):
+        b, rng = self.batch, self.rng
+        if not len(rows):
+            return
+        b.radiation[rows] += _randint(rng, 5, 15, len(rows))
+        if self.encounter_p is None:
+            encounter = rng.integers(0, len(self.encounters), len(rows))
+        else:
+            encounter = rng.choice(len(self.encounters), len(rows), p=self.encounter_p)
+        code = self.encounter_code
+        self.encounters += np.bincount(encounter, minlength=len(self.encounters))
+
+        # scavenge_location
+        scavenge = rows[encounter == code.get('scavenge_location')]
+        loot = self.loot[rng.integers(0, len(self.loot), len(scavenge))]
+        b.items[scavenge] += loot
+        self.found += loot.sum(axis=0)
+
+        # mysterious_sound
+        sound = rows[encounter == code.get('mysterious_sound')]
+        investigate = sound[self.policy.yes(len(sound), rng, game_engine.INVESTIGATE)]
+        lucky = rng.random(len(investigate)) < 0.3
+        found = investigate[lucky]
+        b.items[found, CANNED] += 1
+        b.items[found, WATER] += 1
+        self.found[CANNED] += len(found)
+        self.found[WATER] += len(found)
+        hurt = investigate[~lucky]
+        b.health[hurt] -= _randint(rng, 15, 30, len(hurt))
+
+        # supply_cache: 2-4 distinct cache items
+        cache = rows[encounter == code.get('supply_cache')]
+        count = _randint(rng, 2, 4, len(cache))
+        order = rng.random((len(cache), len(self.cache_columns))).argsort(axis=1).argsort(axis=1)
+        gained = np.zeros((len(cache), len(ITEMS)), dtype=np.int16)
+        gained[:, self.cache_columns] = order < count[:, None]
+        b.items[cache] += gained
+        self.found += gained.sum(axis=0)
+
+        # radiation_storm
+        storm = rows[encounter == code.get('radiation_storm')]
+        masked = b.items[storm, GAS_MASK] > 0
+        b.radiation[storm] += np.where(masked, _randint(rng, 5, 10, len(storm)),
+                                       _randint(rng, 20, 35, len(storm)))
+
+        # creature_encounter
+        creature = rows[encounter == code.get('creature_encounter')]
+        choice = self.policy.creature(b.items[creature], rng)
+        fight = creature[choice == 0]
+        won = rng.random(len(fight)) < 0.6
+        b.items[fight[won], MEAT] += 1
+        self.found[MEAT] += int(won.sum())
+        lost = fight[~won]
+        b.health[lost] -= _randint(rng, 20, 40, len(lost))
+        b.health[creature[choice == 1]] -= 10
+        offer = creature[choice == 2]
+        has_food = b.items[offer, CANNED] > 0
+        self._use_item(offer[has_food], CANNED)
+        attacked = offer[~has_food]
+        b.health[attacked] -= _randint(rng, 15, 25, len(attacked))
+
+    def rest(self, rows):
+        b, rng = self.batch, self.rng
+        if not len(rows):
+            return
+        b.food[rows] -= np.minimum(b.food[rows], 20)
+        b.water[rows] -= np.minimum(b.water[rows], 15)
+
+        eat = rows[b.items[rows, CANNED] > 0]
+        self._use_item(eat, CANNED)
+        b.food[eat] += 30
+        drink = rows[b.items[rows, WATER] > 0]
+        self._use_item(drink, WATER)
+        b.water[drink] += 25
+
+        heal = rows[(b.items[rows, MED_KIT] > 0) & (b.health[rows] < 80)]
+        heal = heal[self.policy.yes(len(heal), rng, game_engine.USE_MED_KIT)]
+        self._use_item(heal, MED_KIT)
+        b.health[heal] += 40
+
+        pills = rows[(b.items[rows, RAD_PILLS] > 0) & (b.radiation[rows] > 20)]
+        pills = pills[self.policy.yes(len(pills), rng, game_engine.TAKE_RAD_PILLS)]
+        self._use_item(pills, RAD_PILLS)
+        b.radiation[pills] -= 30
+
+        # Clamp values
+        b.health[rows] = np.clip(b.health[rows] + 10, 0, 100)
+        b.food[rows] = np.clip(b.food[rows], 0, 100)
+        b.water[rows] = np.clip(b.water[rows], 0, 100)
+        b.radiation[rows] = np.clip(b.radiation[rows], 0, 100)
+        b.day[rows] += 1
+
+    def run(self, max_turns):
+        for _ in range(max_turns):
+            self.check_game_over()
+            if not self.live:
+                break
+            self.turn()
+        if self.live:
+            still_alive = self.batch.alive
+            self.finish(still_alive, np.full(self.live, MAX_TURNS, dtype=np.int8))
+        for name, count in zip(game_engine.ENCOUNTERS, self.encounters.tolist()):
+            self.stats.encounters[name] += count
+        for item, count in zip(ITEMS, self.found.tolist()):
+            if count:
+                self.stats.items_found[item] += count
+        for item, count in zip(ITEMS, self.used.tolist()):
+            if count:
+                self.stats.items_used[item] += count
+
+
+def simulate(games, policy='random', seed=0, batch_size=1_000_000, max_turns=10000):
+    """Simulate games in vectorized batches and return a balance_runner.RunStats"""
+    if np is None:
+        raise RuntimeError("batch_sim requires numpy (pip install numpy)")
+    rng = np.random.default_rng(seed)
+    stats = RunStats()
+    for start in range(0, games, batch_size):
+        size = min(batch_size, games - start)
+        _Simulation(size, POLICIES[policy](), rng, stats).run(max_turns)
+    return stats
+
+
+def compare(games, scalar_games, policy='random', seed=0):
+    """Print batch and scalar engine summaries side by side"""
+    from balance_runner import simulate_chunk
+
+    batch = simulate(games, policy, seed).summary()
+    scalar = simulate_chunk(policy, seed, 0, scalar_games, 10000).summary()
+    print(f"{'':22}{'batch':>12}{'scalar':>12}")
+    for key in ('mean', 'p50', 'p90', 'p99'):
+        print(f"days {key:17}{batch['days_survived'][key]:>12}{scalar['days_survived'][key]:>12}")
+    for cause in sorted(set(batch['cause_of_death']) | set(scalar['cause_of_death'])):
+        print(f"{cause:22}{batch['cause_of_death'].get(cause, 0):>12.3f}"
+              f"{scalar['cause_of_death'].get(cause, 0):>12.3f}")
+    for item in ITEMS:
+        print(f"found {item:16}{batch['items_found_per_game'].get(item, 0):>12.3f}"
+              f"{scalar['items_found_per_game'].get(item, 0):>12.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vectorized wasteland balance simulation")
+    parser.add_argument('--games', type=int, default=1_000_000)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1_000_000)
+    parser.add_argument('--compare', type=int, metavar='N', default=0,
+                        help="also play N games on the scalar engine and compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.games, args.compare, args.policy, args.seed)
+        return
+
+    started = time.perf_counter()
+    stats = simulate(args.games, args.policy, args.seed, args.batch_size)
+    elapsed = time.perf_counter() - started
+    summary = stats.summary()
+    days = summary['days_survived']
+    print(f"📊 {stats.games} games in {elapsed:.2f}s ({stats.games / elapsed:,.0f} games/s)")
+    print(f"⏰ Days survived: mean {days['mean']}, p50 {days['p50']}, "
+          f"p90 {days['p90']}, p99 {days['p99']}, max {days['max']}")
+    for cause, share in summary['cause_of_death'].items():
+        print(f"💀 {cause}: {share:.1%}")
+
+
+if __name__ == '__main__':
+    main()
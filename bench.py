@@ -0,0 +1,376 @@
+"""Load-test the game server.
+
+Starts server.py in a scratch directory against an in-process fake Stripe
+API (see fake_stripe.py), drives a weighted mix of requests from many
+keep-alive connections, and reports throughput plus latency percentiles per
+operation:
+
+    python bench.py --workload mixed --concurrency 16 --duration 10 --out bench.json
+    python bench.py --baseline bench.json          # exit 1 on a regression
+    python bench.py --url http://staging:5000 --workload saves
+
+Pass server options through with --server-args "--save-backend sqlite".
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+from fake_stripe import FakeStripeServer, payment_intent_event, sign_webhook
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+WEBHOOK_SECRET = 'whsec_bench'
+
+# Operation -> relative weight
+WORKLOADS = {
+    'mixed': {'static': 30, 'save': 25, 'load': 25, 'create_payment': 5,
+              'verify_payment': 10, 'webhook': 5},
+    'static': {'static': 1},
+    'saves': {'save': 1, 'load': 1},
+    'payments': {'create_payment': 1, 'verify_payment': 2, 'webhook': 1},
+    'turns': {'action': 1},
+}
+STATIC_PATHS = ('/', '/script.js', '/style.css', '/events.json')
+ITEM_TYPES = ('starter_pack', 'premium_bundle', 'mega_pack')
+
+
+class Connection:
+    """One keep-alive connection that reconnects after errors"""
+
+    def __init__(self, host, port, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self._conn.request(method, path, body=body, headers=headers or {})
+            response = self._conn.getresponse()
+            data = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+            return response.status, data
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Worker:
+    """Issues requests for one connection and keeps its own samples"""
+
+    def __init__(self, index, host, port, players, rng):
+        self.connection = Connection(host, port)
+        self.players = [f"bench_{index}_{n}" for n in range(players)]
+        self.rng = rng
+        self.intents = []
+        self.options = {}  # player_uid -> options of the pending decision
+        self.events = 0
+        self.index = index
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()  # 5xx responses and failed requests
+        self.failures = Counter()  # requests that got no response at all
+
+    def post_json(self, path, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        return self.connection.request('POST', path, body, {
+            'Content-Type': 'application/json', **(headers or {})})
+
+    def op_static(self):
+        return self.connection.request('GET', self.rng.choice(STATIC_PATHS),
+                                       headers={'Accept-Encoding': 'gzip'})
+
+    def op_save(self):
+        player_uid = self.rng.choice(self.players)
+        return self.post_json('/api/save-progress', {
+            'playerName': 'Bench', 'playerUID': player_uid,
+            'health': self.rng.randint(1, 100), 'food': self.rng.randint(0, 100),
+            'water': self.rng.randint(0, 100), 'radiation': self.rng.randint(0, 99),
+            'supplies': self.rng.sample(['canned_food', 'water_bottles', 'med_kit',
+                                         'rad_pills', 'gas_mask'], 3),
+            'gasMaskDurability': {}, 'day': self.rng.randint(1, 60),
+            'bunkerSupplies': {'canned_food': 5, 'water_bottles': 3, 'med_kit': 2},
+            'currentMission': None, 'missionProgress': 0, 'premiumPurchases': [],
+        })
+
+    def op_load(self):
+        return self.connection.request(
+            'GET', f"/api/load-progress?player_uid={self.rng.choice(self.players)}")
+
+    def op_action(self):
+        player_uid = self.rng.choice(self.players)
+        options = self.options.pop(player_uid, None)
+        if options is None:
+            # First sight of the player this run: pick the game up
+            action = {'playerUID': player_uid}
+        elif not options:
+            action = {'playerUID': player_uid, 'restart': True}
+        else:
+            action = {'playerUID': player_uid, 'choice': self.rng.choice(options)}
+        status, body = self.post_json('/api/action', action)
+        if status == 200:
+            result = json.loads(body)
+            self.options[player_uid] = [] if result['gameOver'] else result['pending']['options']
+        return status, body
+
+    def op_create_payment(self):
+        status, body = self.post_json('/api/create-payment', {
+            'item_type': self.rng.choice(ITEM_TYPES), 'player_uid': self.rng.choice(self.players)})
+        if status == 200:
+            self.intents.append(json.loads(body)['payment_intent_id'])
+            del self.intents[:-100]
+        return status, body
+
+    def op_verify_payment(self):
+        if not self.intents:
+            return self.op_create_payment()
+        return self.post_json('/api/verify-payment',
+                              {'payment_intent_id': self.rng.choice(self.intents)})
+
+    def op_webhook(self):
+        self.events += 1
+        event = payment_intent_event(f"evt_bench_{self.index}_{self.events}_{time.time_ns()}",
+                                     f"pi_bench_{self.index}_{self.events}",
+                                     self.rng.choice(self.players), self.rng.choice(ITEM_TYPES))
+        payload = json.dumps(event).encode('utf-8')
+        return self.connection.request('POST', '/api/webhook', payload, {
+            'Content-Type': 'application/json',
+            'Stripe-Signature': sign_webhook(payload, WEBHOOK_SECRET)})
+
+    def run(self, operations, weights, warmup_until, deadline):
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            op = self.rng.choices(operations, weights)[0]
+            try:
+                status, _ = getattr(self, 'op_' + op)()
+            except Exception as e:
+                status = None
+                error = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if started < warmup_until:
+                continue
+            if status is None:
+                self.errors[op] += 1
+                self.failures[op] += 1
+                self.statuses[op][error] += 1
+            else:
+                self.latencies[op].append(elapsed)
+                self.statuses[op][str(status)] += 1
+                if status >= 500:
+                    self.errors[op] += 1
+        self.connection.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, failures, statuses, seconds):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies) + failures,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round((latencies[-1] if latencies else 0.0) * 1000, 3),
+        'statuses': dict(statuses),
+    }
+
+
+def run_load(host, port, workload, concurrency, duration, warmup, players, seed):
+    weights = WORKLOADS[workload]
+    operations = list(weights)
+    workers = [Worker(index, host, port, players, random.Random(f"{seed}:{index}"))
+               for index in range(concurrency)]
+    start = time.perf_counter()
+    warmup_until = start + warmup
+    deadline = warmup_until + duration
+    threads = [threading.Thread(target=worker.run,
+                                args=(operations, list(weights.values()), warmup_until, deadline))
+               for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    all_latencies = []
+    total_errors = total_failures = 0
+    total_statuses = Counter()
+    for op in operations:
+        latencies = [value for worker in workers for value in worker.latencies[op]]
+        errors = sum(worker.errors[op] for worker in workers)
+        failures = sum(worker.failures[op] for worker in workers)
+        statuses = Counter()
+        for worker in workers:
+            statuses.update(worker.statuses[op])
+        results[op] = summarize(latencies, errors, failures, statuses, duration)
+        all_latencies.extend(latencies)
+        total_errors += errors
+        total_failures += failures
+        total_statuses.update(statuses)
+    return (summarize(all_latencies, total_errors, total_failures, total_statuses, duration),
+            results)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(host, port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/readyz')
+            ready = conn.getresponse().status == 200
+            conn.close()
+            if ready:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not become ready")
+
+
+def start_server(workdir, port, stripe_url, server_args):
+    env = dict(os.environ,
+               STRIPE_API_BASE=stripe_url,
+               STRIPE_SECRET_KEY='sk_test_bench',
+               STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+    command = [sys.executable, SERVER_SCRIPT, '--host', '127.0.0.1', '--port', str(port),
+               '--save-path', os.path.join(workdir, 'saves'),
+               '--webhook-db', os.path.join(workdir, 'webhooks.db'),
+               '--entitlements-db', os.path.join(workdir, 'entitlements.db'),
+               # Every connection comes from one IP; measure the server, not
+               # its rate limits (--server-args can turn them back on)
+               '--ip-rate', '0', '--save-rate', '0', '--payment-rate', '0']
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    process = subprocess.Popen(command + server_args, cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return process
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against a previous run's results"""
+    regressions = []
+    old_rps = baseline['total']['throughput_rps']
+    new_rps = results['total']['throughput_rps']
+    if old_rps and new_rps < old_rps * (1 - tolerance):
+        regressions.append(f"throughput {new_rps} req/s vs {old_rps} req/s")
+    for op, stats in results['operations'].items():
+        old = baseline['operations'].get(op)
+        if old and old['p99_ms'] and stats['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{op} p99 {stats['p99_ms']} ms vs {old['p99_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the wasteland server")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=16, help="parallel connections")
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="unmeasured seconds first")
+    parser.add_argument('--players', type=int, default=50, help="player uids per connection")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stripe-latency', type=float, default=0.0,
+                        help="seconds the fake Stripe API adds to every call")
+    parser.add_argument('--url', help="benchmark an already running server instead")
+    parser.add_argument('--server-args', default='', help="extra arguments for server.py")
+    parser.add_argument('--out', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="allowed slowdown against the baseline (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    stripe = process = None
+    workdir = tempfile.TemporaryDirectory(prefix='wasteland-bench-')
+    try:
+        if args.url:
+            target = urlparse(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            stripe = FakeStripeServer(latency=args.stripe_latency).start()
+            host, port = '127.0.0.1', free_port()
+            process = start_server(workdir.name, port, stripe.url, shlex.split(args.server_args))
+            wait_until_ready(host, port)
+
+        print(f"🏋️ {args.workload} workload, {args.concurrency} connections, "
+              f"{args.duration:g}s after {args.warmup:g}s warmup", file=sys.stderr)
+        total, operations = run_load(host, port, args.workload, args.concurrency,
+                                     args.duration, args.warmup, args.players, args.seed)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if stripe is not None:
+            stripe.shutdown()
+            stripe.server_close()
+        workdir.cleanup()
+
+    results = {
+        'config': {key: getattr(args, key) for key in (
+            'workload', 'concurrency', 'duration', 'warmup', 'players', 'seed',
+            'stripe_latency', 'url', 'server_args')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'total': total,
+        'operations': operations,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print(f"{'operation':16}{'requests':>10}{'errors':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in list(operations.items()) + [('total', total)]:
+        print(f"{name:16}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"⚠️ Regression: {regression}")
+        if regressions:
+            return 1
+        print("✅ No regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
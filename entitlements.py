@@ -0,0 +1,140 @@
+"""Premium purchases ("entitlements") per player.
+
+Grants are rows in SQLite keyed by (player_uid, item_type), so granting is a
+single idempotent insert and two concurrent grants for the same player can't
+overwrite each other. Reads go through an in-memory LRU index of
+uid -> purchased items, filled in batches on a miss.
+
+With ``shared=True`` other processes may grant too. Before the index is
+used, each connection checks ``PRAGMA data_version``, which changes whenever
+a different connection has committed. The index is dropped when it does.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_connections import ThreadLocalConnections
+
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_CHUNK = 500
+
+
+class EntitlementStore:
+    """SQLite-backed entitlements with a hot LRU index"""
+
+    def __init__(self, path='wasteland_entitlements.db', cache_size=10000, shared=False):
+        self.path = path
+        self.cache_size = cache_size
+        self.shared = shared
+        self._connections = ThreadLocalConnections(path)
+        # The data_version each thread's connection last saw
+        self._seen = threading.local()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every grant so a lookup that raced with a grant doesn't
+        # put a stale answer in the cache.
+        self._version = 0
+        self._connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS entitlements ("
+            " player_uid TEXT NOT NULL,"
+            " item_type TEXT NOT NULL,"
+            " granted_at REAL NOT NULL,"
+            " payment_intent_id TEXT,"
+            " PRIMARY KEY (player_uid, item_type)"
+            ") WITHOUT ROWID"
+        )
+
+    def grant(self, player_uid, item_type, payment_intent_id=None):
+        """Record a purchase. Returns False if the player already had it"""
+        conn = self._connections.get()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entitlements"
+                " (player_uid, item_type, granted_at, payment_intent_id)"
+                " VALUES (?, ?, ?, ?)",
+                (player_uid, item_type, time.time(), payment_intent_id),
+            )
+        with self._lock:
+            self._version += 1
+            self._cache.pop(player_uid, None)
+        return cursor.rowcount > 0
+
+    def get(self, player_uid):
+        """Return the sorted list of items player_uid has purchased"""
+        return self.get_many([player_uid])[player_uid]
+
+    def get_many(self, player_uids):
+        """Return {player_uid: [items]} for every requested uid"""
+        if self.shared:
+            self._check_external_writes()
+        result = {}
+        missing = []
+        with self._lock:
+            for player_uid in player_uids:
+                items = self._cache.get(player_uid)
+                if items is None:
+                    missing.append(player_uid)
+                else:
+                    self._cache.move_to_end(player_uid)
+                    result[player_uid] = list(items)
+            version = self._version
+        if not missing:
+            return result
+
+        loaded = {player_uid: [] for player_uid in missing}
+        conn = self._connections.get()
+        for start in range(0, len(missing), _LOOKUP_CHUNK):
+            chunk = missing[start:start + _LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                "SELECT player_uid, item_type FROM entitlements"
+                f" WHERE player_uid IN ({placeholders}) ORDER BY player_uid, item_type",
+                chunk,
+            )
+            for player_uid, item_type in rows:
+                loaded[player_uid].append(item_type)
+
+        with self._lock:
+            if version == self._version:
+                for player_uid, items in loaded.items():
+                    self._cache[player_uid] = tuple(items)
+                    self._cache.move_to_end(player_uid)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        result.update(loaded)
+        return result
+
+    def _check_external_writes(self):
+        conn = self._connections.get()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == getattr(self._seen, 'data_version', None):
+            return
+        # Some other connection committed since this one last looked (or this
+        # thread hasn't looked yet). It may have been a grant in another
+        # process, so nothing cached can be trusted.
+        self._seen.data_version = data_version
+        with self._lock:
+            self._version += 1
+            self._cache.clear()
+
+    def import_legacy_files(self, directory='.'):
+        """Grant everything recorded in old premium_{uid}.json files.
+
+        Imported files are renamed to .migrated. Returns the number imported.
+        """
+        imported = 0
+        for path in glob.glob(os.path.join(directory, 'premium_*.json')):
+            player_uid = os.path.basename(path)[len('premium_'):-len('.json')]
+            with open(path, 'r') as f:
+                premium_data = json.load(f)
+            for item_type in premium_data.get('purchases', []):
+                self.grant(player_uid, item_type)
+            os.replace(path, path + '.migrated')
+            imported += 1
+        return imported
+
+    def close(self):
+        self._connections.close_all()
@@ -0,0 +1,93 @@
+"""Wasteland event tables.
+
+Encounters, loot and flavour text are defined in events.json, which is read
+once at import and also served to the browser client. Encounters carry
+weights; each table is sampled in O(1) with a precomputed alias table
+(Vose's method), so adding encounters doesn't slow down picking one.
+
+    {"encounters": {"scavenge_location": 1, "radiation_storm": 0.5, ...},
+     "scavenge_locations": [...], "scavenge_loot": [[...], ...], ...}
+"""
+import json
+import os
+
+EVENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'events.json')
+
+LIST_TABLES = ('scavenge_locations', 'scavenge_loot', 'sounds', 'cache_items', 'creatures')
+
+
+class WeightedTable:
+    """Values sampled in proportion to their weights in O(1)"""
+    __slots__ = ('values', 'weights', 'uniform', '_prob', '_alias')
+
+    def __init__(self, values, weights=None):
+        self.values = tuple(values)
+        if not self.values:
+            raise ValueError("a table needs at least one value")
+        if weights is None:
+            weights = [1] * len(self.values)
+        weights = tuple(float(weight) for weight in weights)
+        if len(weights) != len(self.values):
+            raise ValueError("every value needs exactly one weight")
+        if any(weight < 0 for weight in weights) or not sum(weights):
+            raise ValueError("weights must be non-negative and not all zero")
+        self.weights = weights
+        self.uniform = len(set(weights)) == 1
+        self._prob, self._alias = self._build(weights)
+
+    @staticmethod
+    def _build(weights):
+        # Vose's alias method: scale weights to average 1, then pair each
+        # under-full column with an over-full one that tops it up.
+        n = len(weights)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding error
+        return prob, alias
+
+    def sample(self, rng):
+        if self.uniform:
+            # Same draw as rng.choice, so equal weights keep existing seeds
+            # producing the same games
+            return rng.choice(self.values)
+        column = rng.random() * len(self.values)
+        index = int(column)
+        if column - index >= self._prob[index]:
+            index = self._alias[index]
+        return self.values[index]
+
+    def probabilities(self):
+        total = sum(self.weights)
+        return [weight / total for weight in self.weights]
+
+
+class EventTables:
+    """The parsed contents of an events file"""
+
+    def __init__(self, definition):
+        encounters = definition['encounters']
+        self.encounters = WeightedTable(encounters.keys(), encounters.values())
+        self.scavenge_locations = WeightedTable(definition['scavenge_locations'])
+        self.scavenge_loot = WeightedTable(tuple(loot) for loot in definition['scavenge_loot'])
+        self.sounds = WeightedTable(definition['sounds'])
+        self.cache_items = tuple(definition['cache_items'])
+        self.creatures = WeightedTable(definition['creatures'])
+
+
+def load_event_tables(path=EVENTS_FILE):
+    with open(path, encoding='utf-8') as f:
+        definition = json.load(f)
+    missing = [name for name in ('encounters',) + LIST_TABLES if name not in definition]
+    if missing:
+        raise ValueError(f"{path} is missing tables: {', '.join(missing)}")
+    return EventTables(definition)
@@ -0,0 +1,156 @@
+"""A local stand-in for the parts of the Stripe API the server uses.
+
+Point the server at it with STRIPE_API_BASE so benchmarks and manual testing
+need no network or Stripe account:
+
+    python fake_stripe.py --port 12111 --latency 0.05
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_fake python server.py
+
+It supports creating and retrieving payment intents. An intent created with
+metadata[fake_status]=succeeded reports that status, so a payment can be
+verified end to end. ``sign_webhook`` produces the Stripe-Signature header
+for webhook payloads.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+def sign_webhook(payload, secret, timestamp=None):
+    """Stripe-Signature header value for payload (bytes) signed with secret"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def payment_intent_event(event_id, payment_intent_id, player_uid, item_type,
+                         event_type='payment_intent.succeeded'):
+    """A webhook event body like the ones Stripe sends"""
+    status = 'succeeded' if event_type == 'payment_intent.succeeded' else 'processing'
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {'object': {
+            'id': payment_intent_id,
+            'object': 'payment_intent',
+            'status': status,
+            'metadata': {'player_uid': player_uid, 'item_type': item_type},
+        }},
+    }
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stripe_error(self, status, message):
+        self.send_json(status, {'error': {'type': 'invalid_request_error', 'message': message}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        self.server.simulate_latency()
+        if self.path.rstrip('/') != '/v1/payment_intents':
+            self.stripe_error(404, f"Unrecognized request URL (POST: {self.path})")
+            return
+        if 'amount' not in form:
+            self.stripe_error(400, "Missing required param: amount.")
+            return
+        # Form keys look like metadata[player_uid]
+        metadata = {key[len('metadata['):-1]: values[0] for key, values in form.items()
+                    if key.startswith('metadata[')}
+        intent = self.server.create_intent(int(form['amount'][0]),
+                                           form.get('currency', ['usd'])[0], metadata)
+        self.send_json(200, intent)
+
+    def do_GET(self):
+        self.server.simulate_latency()
+        prefix = '/v1/payment_intents/'
+        intent = None
+        if self.path.startswith(prefix):
+            intent = self.server.intents.get(self.path[len(prefix):])
+        if intent is None:
+            self.stripe_error(404, f"No such payment_intent: '{self.path.rsplit('/', 1)[-1]}'")
+        else:
+            self.send_json(200, intent)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """Keeps payment intents in memory; latency is added to every call"""
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0):
+        super().__init__(address, FakeStripeHandler)
+        self.latency = latency
+        self.intents = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_intent(self, amount, currency, metadata):
+        with self._lock:
+            intent_id = f"pi_fake_{next(self._ids)}"
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'currency': currency,
+            'client_secret': f"{intent_id}_secret_fake",
+            'metadata': metadata,
+            'status': metadata.get('fake_status', 'requires_payment_method'),
+        }
+        self.intents[intent_id] = intent
+        return intent
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        threading.Thread(target=self.serve_forever, name='fake-stripe', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Stripe API for local testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds added to every call, to mimic a real upstream")
+    args = parser.parse_args()
+    server = FakeStripeServer((args.host, args.port), latency=args.latency)
+    print(f"💳 Fake Stripe API on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+"""Headless rules engine for The Wastelands.
+
+The engine holds no I/O: it takes a ``GameState`` plus a choice and returns a
+new state and the list of ``Event``s that happened. Whenever the rules need
+the player to decide something, the state carries a pending ``Decision``
+listing the valid options; a frontend (the CLI in main.py) or a ``Policy``
+(for batch simulation) answers it with ``step``.
+
+A game turn is:
+
+    state, events = start_turn(state, rng)     # death check, radio chatter
+    while state.pending:                       # the action, then follow-ups
+        state, events = step(state, choice, rng)
+
+All randomness comes from the ``random.Random`` passed in, so a game is fully
+reproducible from its seed and choices.
+"""
+import math
+import random
+
+from event_tables import load_event_tables
+from inventory import Inventory
+
+BUNKER_START = {"canned_food": 5, "water_bottles": 3, "med_kit": 2}
+
+# Encounters, loot and flavour text come from events.json
+TABLES = load_event_tables()
+ENCOUNTERS = TABLES.encounters.values
+SCAVENGE_LOCATIONS = TABLES.scavenge_locations.values
+SCAVENGE_LOOT = TABLES.scavenge_loot.values
+SOUNDS = TABLES.sounds.values
+CACHE_ITEMS = TABLES.cache_items
+CREATURES = TABLES.creatures.values
+
+# Decisions the engine can ask for
+ACTION = 'action'
+TAKE_ITEM = 'take_item'
+INVESTIGATE = 'investigate'
+CREATURE = 'creature'
+USE_MED_KIT = 'use_med_kit'
+TAKE_RAD_PILLS = 'take_rad_pills'
+
+ACTIONS = ('supplies', 'wasteland', 'rest', 'radiation', 'quit')
+YES_NO = ('y', 'n')
+CREATURE_CHOICES = ('fight', 'run', 'offer')
+
+# Causes of death reported by check_game_over (plus 'quit' and 'max_turns')
+CAUSES = ('injuries', 'starvation', 'radiation')
+
+
+class Event:
+    """Something that happened, for a frontend to render or a runner to count"""
+    __slots__ = ('kind', 'data')
+
+    def __init__(self, kind, **data):
+        self.kind = kind
+        self.data = data
+
+    def __repr__(self):
+        return f"Event({self.kind!r}, {self.data!r})"
+
+
+class Decision:
+    """A question the engine is waiting on, with the choices it understands"""
+    __slots__ = ('name', 'options')
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = tuple(options)
+
+    def __repr__(self):
+        return f"Decision({self.name!r}, {self.options!r})"
+
+
+class GameState:
+    """Everything the rules need to know about one game"""
+    __slots__ = ('player_name', 'health', 'food', 'water', 'radiation', 'supplies', 'day',
+                 'bunker_supplies', 'game_over', 'cause', 'pending')
+
+    def __init__(self, player_name="Survivor"):
+        self.player_name = player_name
+        self.health = 100
+        self.food = 50
+        self.water = 40
+        self.radiation = 0
+        self.supplies = Inventory()
+        self.day = 1
+        self.bunker_supplies = dict(BUNKER_START)
+        self.game_over = False
+        self.cause = None
+        self.pending = None
+
+    def copy(self):
+        new = GameState.__new__(GameState)
+        new.player_name = self.player_name
+        new.health = self.health
+        new.food = self.food
+        new.water = self.water
+        new.radiation = self.radiation
+        new.supplies = self.supplies.copy()
+        new.day = self.day
+        new.bunker_supplies = dict(self.bunker_supplies)
+        new.game_over = self.game_over
+        new.cause = self.cause
+        new.pending = self.pending
+        return new
+
+    def to_dict(self):
+        """The fields shared with the browser game's save format"""
+        return {
+            'playerName': self.player_name,
+            'health': self.health,
+            'food': self.food,
+            'water': self.water,
+            'radiation': self.radiation,
+            'supplies': self.supplies.to_list(),
+            'day': self.day,
+            'bunkerSupplies': dict(self.bunker_supplies),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load the shared fields of a save.
+
+        Saves come from clients, so a field of the wrong type gets its new
+        game value instead, and supplies or bunker entries that aren't item
+        names with counts are dropped.
+        """
+        player_name = data.get('playerName')
+        state = cls(player_name if isinstance(player_name, str) and player_name else "Survivor")
+        for name, key in (('health', 'health'), ('food', 'food'), ('water', 'water'),
+                          ('radiation', 'radiation'), ('day', 'day')):
+            if _is_number(data.get(key)):
+                setattr(state, name, data[key])
+        supplies = data.get('supplies')
+        if isinstance(supplies, list):
+            state.supplies = Inventory.from_list(item for item in supplies if isinstance(item, str))
+        bunker_supplies = data.get('bunkerSupplies')
+        if isinstance(bunker_supplies, dict):
+            state.bunker_supplies = {item: count for item, count in bunker_supplies.items()
+                                     if isinstance(item, str) and _is_number(count)}
+        return state
+
+
+def _is_number(value):
+    # bool is an int subclass, and NaN or infinity would never end a game
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value))
+
+
+def new_game(player_name="Survivor"):
+    return GameState(player_name)
+
+
+def check_game_over(state):
+    """Return the cause of death, or None if the player is still alive"""
+    if state.health <= 0:
+        return 'injuries'
+    if state.food <= 0 and state.water <= 0:
+        return 'starvation'
+    if state.radiation >= 100:
+        return 'radiation'
+    return None
+
+
+# A context manager factory wrapped around every start_turn and step when
+# set, called with a label such as 'step.action' (see set_turn_hook)
+_turn_hook = None
+
+
+def set_turn_hook(hook):
+    """Wrap engine calls in hook(label), e.g. profiling.Profiler.sample; None removes it"""
+    global _turn_hook
+    _turn_hook = hook
+
+
+def start_turn(state, rng):
+    """Begin a turn: check for death, then ask for the day's action"""
+    if _turn_hook is not None:
+        with _turn_hook('start_turn'):
+            return _start_turn(state, rng)
+    return _start_turn(state, rng)
+
+
+def _start_turn(state, rng):
+    state = state.copy()
+    events = []
+    cause = check_game_over(state)
+    if cause:
+        state.game_over = True
+        state.cause = cause
+        events.append(Event('game_over', cause=cause, day=state.day))
+        return state, events
+    if rng.random() < 0.1:
+        events.append(Event('radio'))
+    state.pending = Decision(ACTION, ACTIONS)
+    return state, events
+
+
+def step(state, choice, rng):
+    """Answer the pending decision with choice and advance the rules"""
+    if state.pending is None:
+        raise ValueError("no decision is pending")
+    if _turn_hook is not None:
+        with _turn_hook(f"step.{state.pending.name}"):
+            return _step(state, choice, rng)
+    return _step(state, choice, rng)
+
+
+def _step(state, choice, rng):
+    state = state.copy()
+    events = []
+    decision, state.pending = state.pending, None
+    DECISION_HANDLERS[decision.name](state, choice, rng, events)
+    if state.pending is None:
+        _end_turn(state)
+    return state, events
+
+
+def _end_turn(state):
+    # Daily resource drain
+    if state.day % 2 == 0:
+        state.food = max(0, state.food - 5)
+        state.water = max(0, state.water - 8)
+
+
+def _action(state, choice, rng, events):
+    handler = ACTION_HANDLERS.get(choice)
+    if handler is None:
+        events.append(Event('invalid_action', choice=choice))
+    else:
+        handler(state, rng, events)
+
+
+def _check_bunker_supplies(state, rng, events):
+    if any(state.bunker_supplies.values()):
+        events.append(Event('bunker_supplies', supplies=dict(state.bunker_supplies)))
+        options = [item for item, count in state.bunker_supplies.items() if count > 0]
+        state.pending = Decision(TAKE_ITEM, options + ['none'])
+    else:
+        events.append(Event('bunker_empty'))
+
+
+def _take_item(state, choice, rng, events):
+    if state.bunker_supplies.get(choice, 0) > 0:
+        state.bunker_supplies[choice] -= 1
+        state.supplies.add(choice)
+        events.append(Event('took_item', item=choice))
+    elif choice == "none":
+        events.append(Event('kept_supplies'))
+    else:
+        events.append(Event('invalid_item', choice=choice))
+
+
+def _enter_wasteland(state, rng, events):
+    # Random radiation exposure
+    radiation_gain = rng.randint(5, 15)
+    state.radiation += radiation_gain
+    events.append(Event('radiation_exposure', amount=radiation_gain))
+
+    # Random encounter
+    encounter = TABLES.encounters.sample(rng)
+    events.append(Event('encounter', encounter=encounter))
+    ENCOUNTER_HANDLERS[encounter](state, rng, events)
+
+
+def _scavenge_location(state, rng, events):
+    location = TABLES.scavenge_locations.sample(rng)
+    found_items = TABLES.scavenge_loot.sample(rng)
+    state.supplies.extend(found_items)
+    events.append(Event('scavenged', location=location, items=list(found_items)))
+
+
+def _mysterious_sound(state, rng, events):
+    events.append(Event('sound', sound=TABLES.sounds.sample(rng)))
+    state.pending = Decision(INVESTIGATE, YES_NO)
+
+
+def _investigate(state, choice, rng, events):
+    if choice == 'y':
+        if rng.random() < 0.3:
+            found = ["canned_food", "water_bottles"]
+            state.supplies.extend(found)
+            events.append(Event('found_cache', items=found))
+        else:
+            damage = rng.randint(15, 30)
+            state.health -= damage
+            events.append(Event('ambushed', damage=damage))
+    else:
+        events.append(Event('retreated'))
+
+
+def _supply_cache(state, rng, events):
+    found = rng.sample(CACHE_ITEMS, rng.randint(2, 4))
+    state.supplies.extend(found)
+    events.append(Event('supply_drop', items=found))
+
+
+def _radiation_storm(state, rng, events):
+    protected = "gas_mask" in state.supplies
+    if protected:
+        rad_gain = rng.randint(5, 10)
+    else:
+        rad_gain = rng.randint(20, 35)
+    state.radiation += rad_gain
+    events.append(Event('radiation_storm', amount=rad_gain, protected=protected))
+
+
+def _creature_encounter(state, rng, events):
+    events.append(Event('creature', creature=TABLES.creatures.sample(rng)))
+    state.pending = Decision(CREATURE, CREATURE_CHOICES)
+
+
+def _creature_choice(state, choice, rng, events):
+    if choice == 'fight':
+        if rng.random() < 0.6:
+            state.supplies.add("meat_ration")
+            events.append(Event('creature_defeated', items=["meat_ration"]))
+        else:
+            damage = rng.randint(20, 40)
+            state.health -= damage
+            events.append(Event('creature_wounded', damage=damage))
+    elif choice == 'run':
+        state.health -= 10
+        events.append(Event('fled', damage=10))
+    elif choice == 'offer' and state.supplies.take("canned_food"):
+        events.append(Event('creature_fed', item="canned_food"))
+    else:
+        damage = rng.randint(15, 25)
+        state.health -= damage
+        events.append(Event('creature_attacked', damage=damage))
+
+
+def _rest(state, rng, events):
+    # Consume resources
+    food_consumed = min(state.food, 20)
+    water_consumed = min(state.water, 15)
+    state.food -= food_consumed
+    state.water -= water_consumed
+    events.append(Event('rested', food=food_consumed, water=water_consumed))
+
+    # Use supplies if available
+    if state.supplies.take("canned_food"):
+        state.food += 30
+        events.append(Event('used_item', item="canned_food", food=30))
+
+    if state.supplies.take("water_bottles"):
+        state.water += 25
+        events.append(Event('used_item', item="water_bottles", water=25))
+
+    if "med_kit" in state.supplies and state.health < 80:
+        state.pending = Decision(USE_MED_KIT, YES_NO)
+    else:
+        _offer_rad_pills(state, events)
+
+
+def _use_med_kit(state, choice, rng, events):
+    if choice == 'y':
+        state.supplies.remove("med_kit")
+        state.health += 40
+        events.append(Event('used_item', item="med_kit", health=40))
+    _offer_rad_pills(state, events)
+
+
+def _offer_rad_pills(state, events):
+    if "rad_pills" in state.supplies and state.radiation > 20:
+        state.pending = Decision(TAKE_RAD_PILLS, YES_NO)
+    else:
+        _finish_rest(state, events)
+
+
+def _take_rad_pills(state, choice, rng, events):
+    if choice == 'y':
+        state.supplies.remove("rad_pills")
+        state.radiation -= 30
+        events.append(Event('used_item', item="rad_pills", radiation=-30))
+    _finish_rest(state, events)
+
+
+def _finish_rest(state, events):
+    # Clamp values
+    state.health = min(100, max(0, state.health + 10))
+    state.food = min(100, max(0, state.food))
+    state.water = min(100, max(0, state.water))
+    state.radiation = min(100, max(0, state.radiation))
+
+    state.day += 1
+    events.append(Event('new_day', day=state.day))
+
+
+def _check_radiation(state, rng, events):
+    events.append(Event('radiation_level', level=state.radiation))
+
+
+def _quit(state, rng, events):
+    state.game_over = True
+    state.cause = 'quit'
+    events.append(Event('quit', day=state.day))
+
+
+ACTION_HANDLERS = {
+    'supplies': _check_bunker_supplies,
+    'wasteland': _enter_wasteland,
+    'rest': _rest,
+    'radiation': _check_radiation,
+    'quit': _quit,
+}
+
+ENCOUNTER_HANDLERS = {
+    "scavenge_location": _scavenge_location,
+    "mysterious_sound": _mysterious_sound,
+    "supply_cache": _supply_cache,
+    "radiation_storm": _radiation_storm,
+    "creature_encounter": _creature_encounter,
+}
+
+_unhandled = set(ENCOUNTERS) - set(ENCOUNTER_HANDLERS)
+if _unhandled:
+    raise ValueError(f"events.json lists encounters with no handler: {sorted(_unhandled)}")
+
+DECISION_HANDLERS = {
+    ACTION: _action,
+    TAKE_ITEM: _take_item,
+    INVESTIGATE: _investigate,
+    CREATURE: _creature_choice,
+    USE_MED_KIT: _use_med_kit,
+    TAKE_RAD_PILLS: _take_rad_pills,
+}
+
+
+class Policy:
+    """Answers decisions in place of a human player"""
+
+    def choose(self, state, decision, rng):
+        raise NotImplementedError
+
+
+class RandomPolicy(Policy):
+    """Picks uniformly among the valid options; never quits by default"""
+
+    def __init__(self, allow_quit=False):
+        self.allow_quit = allow_quit
+
+    def choose(self, state, decision, rng):
+        options = decision.options
+        if decision.name == ACTION and not self.allow_quit:
+            options = tuple(option for option in options if option != 'quit')
+        return rng.choice(options)
+
+
+class SurvivorPolicy(Policy):
+    """A cautious rule-of-thumb player, useful as a balance baseline"""
+
+    def choose(self, state, decision, rng):
+        if decision.name == ACTION:
+            if any(state.bunker_supplies.values()) and len(state.supplies) < 2:
+                return 'supplies'
+            if (state.food < 40 or state.water < 40 or state.health < 60
+                    or state.radiation >= 60):
+                return 'rest'
+            return 'wasteland'
+        if decision.name == TAKE_ITEM:
+            return decision.options[0]
+        if decision.name == INVESTIGATE:
+            return 'n'
+        if decision.name == CREATURE:
+            return 'offer' if "canned_food" in state.supplies else 'fight'
+        return 'y'
+
+
+def run_game(policy, seed=None, max_turns=10000, player_name="Survivor", observer=None):
+    """Play one game to the end with policy answering every decision.
+
+    observer, if given, is called with each list of events. Returns the final
+    state; games still running after max_turns end with cause 'max_turns'.
+    """
+    rng = random.Random(seed)
+    # Keep the policy's randomness off the rules' stream so a policy change
+    # doesn't shift every later roll of the dice.
+    policy_rng = random.Random(rng.getrandbits(64))
+    state = new_game(player_name)
+    for _ in range(max_turns):
+        state, events = start_turn(state, rng)
+        if observer:
+            observer(events)
+        while state.pending is not None:
+            state, events = step(state, policy.choose(state, state.pending, policy_rng), rng)
+            if observer:
+                observer(events)
+        if state.game_over:
+            return state
+    state.game_over = True
+    state.cause = 'max_turns'
+    return state
@@ -0,0 +1,134 @@
+"""Compact player inventory.
+
+The engine's items have small integer ids and an ``Inventory`` keeps one
+count per id, so membership, counting, adding and removing are O(1) and
+memory depends on how many kinds of item a player holds, not how many. The
+serialized form is the flat list of item names the browser game keeps in
+``supplies``, e.g. ``["canned_food", "canned_food", "med_kit"]``.
+
+Saves can hold items the engine doesn't know, such as the browser game's
+crafting parts. Those are counted by name in a dict of the inventory's own,
+so names sent by clients never accumulate in process-wide state.
+"""
+
+# The engine's items, in id order. Ids are only stable within one process;
+# always serialize names, never ids.
+ITEMS = ("canned_food", "water_bottles", "med_kit", "rad_pills", "gas_mask", "meat_ration")
+
+ITEM_IDS = {item: index for index, item in enumerate(ITEMS)}
+
+
+def item_id(item):
+    """The id of one of the engine's items, or None for any other name"""
+    return ITEM_IDS.get(item)
+
+
+def item_name(index):
+    return ITEMS[index]
+
+
+class Inventory:
+    """Multiset of items, counted by id (or by name for unknown items)"""
+    __slots__ = ('_counts', '_extra', '_size')
+
+    def __init__(self, items=()):
+        self._counts = {}  # item id -> count, only for items held
+        self._extra = None  # unknown item name -> count, once there is one
+        self._size = 0
+        self.extend(items)
+
+    @classmethod
+    def from_list(cls, items):
+        """Load a saved supplies list"""
+        return cls(items or ())
+
+    def to_list(self):
+        """The supplies list the browser game saves"""
+        items = [ITEMS[index] for index, count in self._counts.items() for _ in range(count)]
+        if self._extra:
+            items.extend(name for name, count in self._extra.items() for _ in range(count))
+        return items
+
+    def copy(self):
+        new = Inventory.__new__(Inventory)
+        new._counts = self._counts.copy()
+        new._extra = self._extra.copy() if self._extra else None
+        new._size = self._size
+        return new
+
+    def count(self, item):
+        index = ITEM_IDS.get(item)
+        if index is not None:
+            return self._counts.get(index, 0)
+        return self._extra.get(item, 0) if self._extra else 0
+
+    def add(self, item, count=1):
+        index = ITEM_IDS.get(item)
+        if index is not None:
+            self._counts[index] = self._counts.get(index, 0) + count
+        else:
+            if not isinstance(item, str):
+                raise TypeError(f"item names must be strings, not {type(item).__name__}")
+            if self._extra is None:
+                self._extra = {}
+            self._extra[item] = self._extra.get(item, 0) + count
+        self._size += count
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def take(self, item):
+        """Remove one item if present; return whether one was removed"""
+        index = ITEM_IDS.get(item)
+        if index is not None:
+            table, key = self._counts, index
+        elif self._extra:
+            table, key = self._extra, item
+        else:
+            return False
+        count = table.get(key, 0)
+        if not count:
+            return False
+        if count == 1:
+            del table[key]
+        else:
+            table[key] = count - 1
+        self._size -= 1
+        return True
+
+    def remove(self, item):
+        """Remove one item, raising ValueError if there is none (like list.remove)"""
+        if not self.take(item):
+            raise ValueError(f"{item!r} not in inventory")
+
+    def items(self):
+        """(name, count) pairs for the items held"""
+        pairs = [(ITEMS[index], count) for index, count in self._counts.items()]
+        if self._extra:
+            pairs.extend(self._extra.items())
+        return pairs
+
+    def __contains__(self, item):
+        index = ITEM_IDS.get(item)
+        if index is not None:
+            return index in self._counts
+        return bool(self._extra) and item in self._extra
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __eq__(self, other):
+        if isinstance(other, Inventory):
+            return (self._counts == other._counts
+                    and (self._extra or {}) == (other._extra or {}))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Inventory({self.to_list()!r})"
@@ -0,0 +1,247 @@
+"""Idle connections, held off the worker pool.
+
+A worker thread that waits on a keep-alive socket for the client's next
+request is a worker serving no one. A client that opens a connection and
+sends its request a byte at a time holds one just the same. Either way a
+handful of sockets can occupy the whole pool.
+
+``IdleConnections`` is one selector thread that holds every connection
+while it has no complete request head: fresh connections, and kept-alive
+ones between requests. It reads whatever arrives into the connection's
+buffer. Once a whole head (request line and headers) is in, it hands the
+connection to ``dispatch``, which queues it for a worker. A worker therefore
+only ever holds a connection that has a request ready, and hands it back
+here when the response is sent.
+
+The handler's ``rfile`` starts with the buffered bytes (see
+``Connection.makefile``). Whatever it had read past the request, such as a
+pipelined next request, goes back into the buffer when the handler is done.
+"""
+import collections
+import io
+import selectors
+import socket
+import threading
+import time
+
+# Longest request head accepted while idle; http.server's own line limit
+MAX_HEAD = 64 * 1024
+READ_SIZE = 16 * 1024
+
+_HEAD_TOO_LARGE = (b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+                   b"Connection: close\r\nContent-Length: 0\r\n\r\n")
+
+
+class _BufferedSocketIO(io.RawIOBase):
+    """Reads the connection's buffered bytes, then the socket"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._prefix = bytes(connection.buffer)
+        self._pos = 0
+        self.stopped = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos < len(self._prefix):
+            n = min(len(b), len(self._prefix) - self._pos)
+            b[:n] = self._prefix[self._pos:self._pos + n]
+            self._pos += n
+            return n
+        if self.stopped:
+            return None
+        return self._connection.sock.recv_into(b)
+
+
+class _ConnectionReader(io.BufferedReader):
+    def close(self):
+        if not self.closed:
+            # Keep what was read ahead of the request for the next one,
+            # without waiting on the socket for more
+            raw = self.raw
+            unread_prefix = raw._prefix[raw._pos:]
+            raw._pos = len(raw._prefix)
+            raw.stopped = True
+            # read1 now returns only what is already buffered, which comes
+            # before the rest of the prefix
+            raw._connection.buffer = bytearray(self.read1(MAX_HEAD) + unread_prefix)
+        super().close()
+
+
+class Connection:
+    """An accepted socket and any request bytes read ahead of the handler.
+
+    Handlers get this in place of the socket; everything but makefile('rb')
+    goes straight through to the socket.
+    """
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray()
+        self.served = False  # has had at least one request
+        self.deadline = None
+
+    def makefile(self, mode='r', buffering=-1):
+        if 'r' not in mode:
+            return self.sock.makefile(mode, buffering)
+        if buffering is None or buffering < 1:
+            buffering = io.DEFAULT_BUFFER_SIZE
+        return _ConnectionReader(_BufferedSocketIO(self), buffering)
+
+    def has_request(self):
+        """True once the buffer holds a whole request head"""
+        return b'\n\r\n' in self.buffer or b'\n\n' in self.buffer
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class IdleConnections:
+    """Waits on idle connections and dispatches them once a request arrives"""
+
+    def __init__(self, dispatch, close, timeout=5.0):
+        # dispatch(connection) queues it for a worker; close(connection)
+        # closes it. Both are called on this object's thread.
+        self.dispatch = dispatch
+        self.close_connection = close
+        self.timeout = timeout
+        self._selector = selectors.DefaultSelector()
+        self._waiting = collections.OrderedDict()  # fd -> connection, oldest first
+        self._incoming = []
+        self._evict = 0
+        self._draining = False
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name='idle-connections',
+                                        daemon=True)
+        self._thread.start()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except BlockingIOError:
+            pass  # already woken
+
+    def park(self, connection):
+        """Wait for connection's next request. Safe to call from any thread"""
+        with self._lock:
+            self._incoming.append(connection)
+        self._wake()
+
+    def evict_oldest(self):
+        """Close the longest-waiting idle connection to make room for a new one"""
+        with self._lock:
+            self._evict += 1
+        self._wake()
+
+    def drain(self):
+        """Close connections between requests; ones awaiting a first request stay"""
+        with self._lock:
+            self._draining = True
+        self._wake()
+
+    def close(self):
+        """Close every waiting connection and stop"""
+        with self._lock:
+            self._stopping = True
+        self._wake()
+        self._thread.join()
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._waiting:
+                oldest = next(iter(self._waiting.values()))
+                timeout = max(0.0, oldest.deadline - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._read(key.data)
+            if not self._apply_requests():
+                return
+            self._expire()
+
+    def _apply_requests(self):
+        # Returns False once asked to stop
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+            evict, self._evict = self._evict, 0
+            draining, stopping = self._draining, self._stopping
+        if stopping:
+            for connection in incoming + list(self._waiting.values()):
+                self._close(connection)
+            return False
+        for connection in incoming:
+            if draining and connection.served:
+                self.close_connection(connection)
+            elif connection.has_request():
+                # Pipelined: the next request was read along with the last
+                self.dispatch(connection)
+            else:
+                self._wait(connection)
+        for _ in range(min(evict, len(self._waiting))):
+            self._close(next(iter(self._waiting.values())))
+        if draining:
+            for connection in list(self._waiting.values()):
+                if connection.served:
+                    self._close(connection)
+        return True
+
+    def _wait(self, connection):
+        connection.sock.setblocking(False)
+        connection.deadline = time.monotonic() + self.timeout
+        self._selector.register(connection.sock, selectors.EVENT_READ, connection)
+        self._waiting[connection.sock.fileno()] = connection
+
+    def _unwait(self, connection):
+        del self._waiting[connection.sock.fileno()]
+        self._selector.unregister(connection.sock)
+
+    def _close(self, connection):
+        self._unwait(connection)
+        self.close_connection(connection)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(connection)
+            return
+        start = max(0, len(connection.buffer) - 2)
+        connection.buffer += data
+        if b'\n\r\n' in connection.buffer[start:] or b'\n\n' in connection.buffer[start:]:
+            self._unwait(connection)
+            self.dispatch(connection)
+        elif len(connection.buffer) > MAX_HEAD:
+            try:
+                connection.sock.send(_HEAD_TOO_LARGE)
+            except OSError:
+                pass
+            self._close(connection)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._waiting:
+            connection = next(iter(self._waiting.values()))
+            if connection.deadline > now:
+                break
+            self._close(connection)
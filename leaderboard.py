@@ -0,0 +1,295 @@
+"""Leaderboard and run statistics.
+
+Finished runs are folded into running aggregates as they arrive:
+
+- the top ``top_k`` runs, one per player, kept in a min-heap whose root is
+  the run a better one would push out;
+- a histogram of days survived and a count of deaths per cause.
+
+Nothing is rescanned on read. ``snapshot()`` returns a JSON document built
+from those aggregates, which costs O(K) and is cached until something
+changes, so /api/leaderboard is served from memory however many runs have
+been recorded.
+
+Every ``persist_interval`` seconds the runs recorded since the last write are
+merged into the JSON file under a file lock, and the merged result becomes
+the new base. Several server processes can therefore share one file: each
+adds only its own runs and picks up everyone else's on the next write.
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: only a single process uses the file
+    fcntl = None
+
+CAUSES = ('injuries', 'starvation', 'radiation')
+
+# Upper bounds of the days-survived histogram buckets; the last bucket is
+# everything above the final bound
+DAY_BUCKETS = (1, 2, 3, 5, 7, 10, 15, 20, 30, 50, 75, 100, 150, 200, 365)
+
+MAX_DAYS = 100000
+MAX_NAME_LENGTH = 24
+
+
+def validate_run(run):
+    """Return (days, cause, name) from a submitted run, or raise ValueError"""
+    days = run.get('days')
+    cause = run.get('cause')
+    name = run.get('playerName')
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be a whole number from 1 to {MAX_DAYS}")
+    if cause not in CAUSES:
+        raise ValueError(f"cause must be one of {', '.join(CAUSES)}")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("playerName is required")
+    return days, cause, name.strip()[:MAX_NAME_LENGTH]
+
+
+def empty_state():
+    """Aggregates with no runs, in the file format"""
+    return {
+        'runs': 0,
+        'total_days': 0,
+        'deaths': dict.fromkeys(CAUSES, 0),
+        'day_counts': [0] * (len(DAY_BUCKETS) + 1),
+        'top': [],  # [player_uid, name, days, cause], best first
+    }
+
+
+def merge_states(older, newer, top_k):
+    """Combine two sets of aggregates; on equal days the older run ranks higher"""
+    best = {}
+    for entry in older['top'] + newer['top']:
+        current = best.get(entry[0])
+        if current is None or entry[2] > current[2]:
+            best[entry[0]] = entry
+    return {
+        'runs': older['runs'] + newer['runs'],
+        'total_days': older['total_days'] + newer['total_days'],
+        'deaths': {cause: older['deaths'].get(cause, 0) + newer['deaths'].get(cause, 0)
+                   for cause in CAUSES},
+        'day_counts': [a + b for a, b in zip(older['day_counts'], newer['day_counts'])],
+        # sorted is stable, so older entries stay ahead on ties
+        'top': sorted(best.values(), key=lambda entry: -entry[2])[:top_k],
+    }
+
+
+class Leaderboard:
+    """Top runs and run statistics, maintained incrementally"""
+
+    def __init__(self, path='wasteland_leaderboard.json', top_k=100, persist_interval=5.0):
+        self.path = path
+        self.top_k = top_k
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._base = empty_state()  # what the file held at the last read
+        self._base_mtime = None
+        self._pending = None  # runs being written right now
+        self._seq = itertools.count()
+        self._reset_delta()
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+        self._closed = False
+        self._refresh_base()
+        self._thread = None
+        if persist_interval:
+            self._thread = threading.Thread(target=self._run, name='leaderboard-persist',
+                                            daemon=True)
+            self._thread.start()
+
+    def _reset_delta(self):
+        # Runs recorded since the last write. The heap holds
+        # (days, -seq, player_uid, name, cause): the root is the lowest
+        # scoring run, and of equal scores the most recent one
+        self._heap = []
+        self._top = {}  # player_uid -> its heap entry
+        self._day_counts = [0] * (len(DAY_BUCKETS) + 1)
+        self._deaths = dict.fromkeys(CAUSES, 0)
+        self._runs = 0
+        self._total_days = 0
+
+    def record(self, player_uid, run):
+        """Fold a finished run in. Returns its leaderboard rank, or None"""
+        days, cause, name = validate_run(run)
+        with self._lock:
+            self._runs += 1
+            self._total_days += days
+            self._deaths[cause] += 1
+            self._day_counts[self._day_bucket(days)] += 1
+            self._version += 1
+            self._offer((days, -next(self._seq), player_uid, name, cause))
+            return self._rank(player_uid, days)
+
+    @staticmethod
+    def _day_bucket(days):
+        for index, bound in enumerate(DAY_BUCKETS):
+            if days <= bound:
+                return index
+        return len(DAY_BUCKETS)
+
+    def _offer(self, entry):
+        # Caller holds self._lock
+        player_uid = entry[2]
+        current = self._top.get(player_uid)
+        if current is not None:
+            if entry[0] <= current[0]:
+                return
+            # Replace the player's previous best in place
+            self._heap[self._heap.index(current)] = entry
+            heapq.heapify(self._heap)
+        elif len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            del self._top[heapq.heapreplace(self._heap, entry)[2]]
+        else:
+            return
+        self._top[player_uid] = entry
+
+    def _rank(self, player_uid, days):
+        # Caller holds self._lock. Every run already on the board is older,
+        # so it ranks ahead on equal days. O(K) over the board's parts.
+        best = {}
+        for uid, _, other_days, _ in self._top_sources():
+            best[uid] = max(best.get(uid, 0), other_days)
+        if best.pop(player_uid, 0) > days:
+            return None  # not the player's best run
+        rank = 1 + sum(1 for other_days in best.values() if other_days >= days)
+        return rank if rank <= self.top_k else None
+
+    def _top_sources(self):
+        # Caller holds self._lock
+        yield from self._base['top']
+        if self._pending is not None:
+            yield from self._pending['top']
+        for days, _, uid, name, cause in self._heap:
+            yield uid, name, days, cause
+
+    def _delta_state(self):
+        # Caller holds self._lock
+        return {
+            'runs': self._runs,
+            'total_days': self._total_days,
+            'deaths': dict(self._deaths),
+            'day_counts': list(self._day_counts),
+            'top': [[uid, name, days, cause]
+                    for days, _, uid, name, cause in sorted(self._heap, reverse=True)],
+        }
+
+    def _merged(self):
+        # Caller holds self._lock
+        state = self._base
+        if self._pending is not None:
+            state = merge_states(state, self._pending, self.top_k)
+        return merge_states(state, self._delta_state(), self.top_k)
+
+    def snapshot(self):
+        """The leaderboard and statistics as encoded JSON"""
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._snapshot = json.dumps(self._build_snapshot(self._merged())).encode('utf-8')
+                self._snapshot_version = self._version
+            return self._snapshot
+
+    @staticmethod
+    def _build_snapshot(state):
+        histogram = [{'le': bound, 'runs': count}
+                     for bound, count in zip(DAY_BUCKETS, state['day_counts'])]
+        histogram.append({'le': None, 'runs': state['day_counts'][-1]})
+        runs = state['runs']
+        return {
+            'top': [{'rank': rank, 'playerName': name, 'days': days, 'cause': cause}
+                    for rank, (_, name, days, cause) in enumerate(state['top'], 1)],
+            'stats': {
+                'runs': runs,
+                'meanDays': round(state['total_days'] / runs, 2) if runs else 0,
+                'bestDays': state['top'][0][2] if state['top'] else 0,
+                'deaths': dict(state['deaths']),
+                'daysHistogram': histogram,
+            },
+            'generatedAt': int(time.time()),
+        }
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return empty_state()
+        if len(state['day_counts']) != len(DAY_BUCKETS) + 1:
+            # Written with different buckets; the other totals still apply
+            state['day_counts'] = [0] * (len(DAY_BUCKETS) + 1)
+        return state
+
+    def _refresh_base(self):
+        """Reload the file if another process has written it"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._base_mtime:
+            return
+        state = self._read_file()
+        with self._lock:
+            self._base = state
+            self._base_mtime = mtime
+            self._version += 1
+
+    def persist(self):
+        """Merge the runs recorded since the last write into the file"""
+        with self._lock:
+            # A pending set left by a failed write goes out before new runs
+            if self._pending is None and self._runs:
+                self._pending = self._delta_state()
+                self._reset_delta()
+            pending = self._pending
+        if pending is None:
+            self._refresh_base()
+            return
+
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = merge_states(self._read_file(), pending, self.top_k)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.path)
+            mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            self._base = state
+            self._base_mtime = mtime
+            self._pending = None
+            self._version += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self.persist_interval)
+                closed = self._closed
+            try:
+                self.persist()
+            except (OSError, ValueError) as e:
+                # The runs stay pending and are retried on the next write
+                print(f"Error saving leaderboard: {e}")
+            if closed:
+                return
+
+    def close(self):
+        """Stop the persister after a final write"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.persist()
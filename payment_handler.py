@@ -1,17 +1,114 @@
 
+"""Stripe payments.
+
+This module is the Stripe stack: importing it imports stripe and requests,
+which is slow, so the server imports it on the first request that needs it.
+Configuration comes from a settings.Settings built at startup.
+"""
 import stripe
-import os
-from dotenv import load_dotenv
-import json
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from entitlements import EntitlementStore
+from metrics import NullRegistry
+from profiling import span
+from verify_cache import VerificationCache, verification_result
+
+
+def stripe_endpoint(method, url):
+    """Metric label for a Stripe API call, with object ids collapsed"""
+    parts = urlparse(url).path.strip('/').split('/')
+    # /v1/<resource>/<id>/<action>
+    if len(parts) > 2:
+        parts[2] = ':id'
+    return f"{method.upper()} /{'/'.join(parts)}"
 
-load_dotenv()
+class InstrumentedRequestsClient(stripe.RequestsClient):
+    """RequestsClient that records the latency and errors of every attempt
+
+    latency_observer, if given, is called with each attempt's duration.
+    """
+
+    def __init__(self, registry, latency_observer=None, **kwargs):
+        super().__init__(**kwargs)
+        self._latency_observer = latency_observer
+        self._seconds = registry.histogram(
+            'wasteland_stripe_request_seconds', "Stripe API call latency, per attempt",
+            ('endpoint',))
+        self._errors = registry.counter(
+            'wasteland_stripe_errors_total', "Failed Stripe API attempts",
+            ('endpoint', 'reason'))
+
+    def request(self, method, url, headers, post_data=None):
+        endpoint = stripe_endpoint(method, url)
+        started = time.perf_counter()
+        try:
+            with span(f"stripe {endpoint}"):
+                response = super().request(method, url, headers, post_data)
+        except stripe.error.APIConnectionError:
+            self._errors.inc(endpoint, 'connection')
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._seconds.observe(elapsed, endpoint)
+            if self._latency_observer is not None:
+                self._latency_observer(elapsed)
+        status = response[1]
+        if status >= 400:
+            self._errors.inc(endpoint, str(status))
+        return response
+
+def configure_stripe_client(api_key=None, api_base=None, timeout=10.0, max_retries=2,
+                            pool_size=16, metrics=None, latency_observer=None):
+    """Route all Stripe calls through one pooled keep-alive HTTP client
+
+    Retries use the Stripe library's exponential backoff with jitter.
+    api_base points the library at another endpoint, such as a local
+    stripe-mock instance in tests. With a metrics registry every attempt's
+    latency and failures are recorded, and latency_observer is called with
+    each attempt's duration.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if (metrics is not None and metrics.enabled) or latency_observer is not None:
+        stripe.default_http_client = InstrumentedRequestsClient(
+            metrics or NullRegistry(), latency_observer, timeout=timeout, session=session)
+    else:
+        stripe.default_http_client = stripe.RequestsClient(timeout=timeout, session=session)
+    stripe.api_key = api_key
+    stripe.max_network_retries = max_retries
+    if api_base:
+        stripe.api_base = api_base
+
+
+def create_payment_processor(settings, entitlement_store=None, metrics=None,
+                             latency_observer=None):
+    """Build the process-wide PaymentProcessor from settings"""
+    configure_stripe_client(
+        api_key=settings.stripe_secret_key,
+        api_base=settings.stripe_api_base,
+        timeout=settings.stripe_timeout,
+        max_retries=settings.stripe_max_retries,
+        pool_size=settings.stripe_pool_size,
+        metrics=metrics,
+        latency_observer=latency_observer,
+    )
+    return PaymentProcessor(webhook_secret=settings.stripe_webhook_secret,
+                            entitlement_store=entitlement_store,
+                            pending_ttl=settings.stripe_verify_pending_ttl)
 
-# Initialize Stripe with your secret key
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 
 class PaymentProcessor:
-    def __init__(self):
-        self.webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
+    """Stripe payment operations. Create one per process and share it"""
+
+    def __init__(self, webhook_secret=None, entitlement_store=None, pending_ttl=2.0):
+        self.webhook_secret = webhook_secret
+        self.entitlement_store = entitlement_store or EntitlementStore()
+        self.verification_cache = VerificationCache(pending_ttl=pending_ttl)
     
     def create_payment_intent(self, amount_cents, currency='usd', metadata=None):
         """Create a payment intent for processing"""
@@ -37,36 +134,53 @@ class PaymentProcessor:
     
     def verify_payment(self, payment_intent_id):
         """Verify a payment was successful"""
+        return self.verification_cache.get_or_fetch(payment_intent_id, self._retrieve_payment)
+
+    def _retrieve_payment(self, payment_intent_id):
+        """Look up a payment intent's status at Stripe"""
         try:
             intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            return {
-                'success': True,
-                'status': intent.status,
-                'paid': intent.status == 'succeeded'
-            }
+            return verification_result(intent.status)
         except stripe.error.StripeError as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def handle_webhook(self, payload, sig_header):
-        """Handle Stripe webhook events"""
+    def construct_event(self, payload, sig_header):
+        """Verify a webhook signature and return the parsed event
+
+        Raises ValueError if the payload or signature is invalid.
+        """
         try:
-            event = stripe.Webhook.construct_event(
+            return stripe.Webhook.construct_event(
                 payload, sig_header, self.webhook_secret
             )
-            
-            if event['type'] == 'payment_intent.succeeded':
-                payment_intent = event['data']['object']
-                # Handle successful payment
-                return self._process_successful_payment(payment_intent)
-            
-            return {'success': True, 'processed': False}
-            
-        except (ValueError, stripe.error.SignatureVerificationError) as e:
+        except stripe.error.SignatureVerificationError as e:
+            raise ValueError(str(e))
+
+    def process_event(self, event):
+        """Apply a verified webhook event"""
+        if event['type'].startswith('payment_intent.'):
+            payment_intent = event['data']['object']
+            self.verification_cache.record(payment_intent['id'], payment_intent['status'])
+
+        if event['type'] == 'payment_intent.succeeded':
+            payment_intent = event['data']['object']
+            # Handle successful payment
+            return self._process_successful_payment(payment_intent)
+
+        return {'success': True, 'processed': False}
+
+    def handle_webhook(self, payload, sig_header):
+        """Handle Stripe webhook events"""
+        try:
+            event = self.construct_event(payload, sig_header)
+            return self.process_event(event)
+
+        except ValueError as e:
             return {'success': False, 'error': str(e)}
-    
+
     def _process_successful_payment(self, payment_intent):
         """Process successful payment and grant premium access"""
         metadata = payment_intent.get('metadata', {})
@@ -75,7 +189,7 @@ class PaymentProcessor:
         
         if player_uid and item_type:
             # Grant premium access to player
-            self._grant_premium_access(player_uid, item_type)
+            self._grant_premium_access(player_uid, item_type, payment_intent.get('id'))
             return {
                 'success': True,
                 'processed': True,
@@ -85,22 +199,8 @@ class PaymentProcessor:
         
         return {'success': True, 'processed': False}
     
-    def _grant_premium_access(self, player_uid, item_type):
+    def _grant_premium_access(self, player_uid, item_type, payment_intent_id=None):
         """Grant premium access to a player"""
-        premium_file = f"premium_{player_uid}.json"
-        
-        try:
-            if os.path.exists(premium_file):
-                with open(premium_file, 'r') as f:
-                    premium_data = json.load(f)
-            else:
-                premium_data = {'purchases': []}
-            
-            if item_type not in premium_data['purchases']:
-                premium_data['purchases'].append(item_type)
-                
-                with open(premium_file, 'w') as f:
-                    json.dump(premium_data, f)
-                    
-        except Exception as e:
-            print(f"Error granting premium access: {e}")
+        # Errors propagate so the webhook is retried instead of the purchase
+        # being silently dropped.
+        self.entitlement_store.grant(player_uid, item_type, payment_intent_id)
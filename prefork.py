@@ -0,0 +1,229 @@
+"""Pre-fork mode: several server processes sharing one port.
+
+``python server.py --processes N`` starts a supervisor instead of a server.
+It runs the one-off storage migrations, then launches N copies of server.py
+as workers. Every worker binds the same port with SO_REUSEPORT, and the
+kernel spreads incoming connections between them. Each worker has its own
+interpreter and GIL, so JSON work scales with cores.
+
+The supervisor:
+
+- restarts a worker that exits unexpectedly, backing off if it keeps crashing;
+- on SIGHUP, replaces the workers one at a time. A replacement must report
+  ready before its predecessor is told to drain, so the port never goes
+  unserved. Workers are fresh interpreters, so a reload picks up new code;
+- on SIGTERM or SIGINT, drains every worker and exits.
+
+Workers share nothing in memory. Anything that must agree across them goes
+through storage: saves are written through instead of buffered, and
+``PlayerFileLocks`` serialize each player's saves across processes.
+"""
+import fcntl
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+# Seconds a new worker gets to report ready
+READY_TIMEOUT = 30.0
+# A worker that dies sooner than this after starting counts as crashing
+MIN_UPTIME = 5.0
+MAX_RESTART_DELAY = 30.0
+
+
+class PlayerFileLocks:
+    """Per-player locks that exclude other threads and other processes.
+
+    Players hash onto stripes, each one byte of a shared lock file locked
+    with lockf. lockf locks belong to the process, so a thread lock per
+    stripe keeps threads of the same process apart as well.
+    """
+
+    def __init__(self, path, stripes=64):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, player_uid):
+        # hash() is salted per process, so stripes use a stable hash
+        return zlib.crc32(player_uid.encode('utf-8')) % len(self._thread_locks)
+
+    @contextmanager
+    def _hold(self, stripe):
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def __call__(self, player_uid):
+        return self._hold(self._stripe(player_uid))
+
+    @contextmanager
+    def many(self, player_uids):
+        """Lock several players at once; stripes are taken in order, so no deadlock"""
+        with ExitStack() as stack:
+            for stripe in sorted({self._stripe(player_uid) for player_uid in player_uids}):
+                stack.enter_context(self._hold(stripe))
+            yield
+
+    def close(self):
+        os.close(self._fd)
+
+
+def signal_ready(ready_fd):
+    """Tell the supervisor this worker is serving"""
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+
+def watch_parent(on_orphaned, interval=1.0):
+    """Call on_orphaned once if the supervisor goes away without stopping us"""
+    parent = os.getppid()
+
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(interval)
+        on_orphaned()
+
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+
+
+class _Worker:
+    __slots__ = ('index', 'process', 'started')
+
+    def __init__(self, index, process):
+        self.index = index
+        self.process = process
+        self.started = time.monotonic()
+
+
+class Supervisor:
+    """Keeps ``processes`` server workers running"""
+
+    def __init__(self, command, processes, drain_timeout=10.0):
+        # command runs the server as given on the command line; workers get
+        # their index and ready pipe appended
+        self.command = list(command)
+        self.processes = processes
+        self.drain_timeout = drain_timeout
+        self.workers = {}
+        self._restart_delay = {}  # index -> last backoff used
+        self._restart_at = {}  # index -> when to start it again
+        self._stopping = False
+        self._reload = False
+
+    def spawn(self, index):
+        """Start worker index and wait for it to report ready. None if it didn't"""
+        read_fd, write_fd = os.pipe()
+        command = [*self.command, '--worker-index', str(index), '--ready-fd', str(write_fd)]
+        # Its own session, so a Ctrl-C reaches only the supervisor, which
+        # then drains the workers in order
+        process = subprocess.Popen(command, pass_fds=(write_fd,), start_new_session=True)
+        os.close(write_fd)
+        try:
+            ready, _, _ = select.select([read_fd], [], [], READY_TIMEOUT)
+            ok = bool(ready) and os.read(read_fd, 1) == b'1'
+        finally:
+            os.close(read_fd)
+        if not ok:
+            print(f"❌ Worker {index} (pid {process.pid}) didn't start")
+            self.stop_worker(process)
+            return None
+        return _Worker(index, process)
+
+    def stop_worker(self, process):
+        """Ask a worker to drain, then kill it if it takes too long"""
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(self.drain_timeout + 5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def start_worker(self, index):
+        worker = self.spawn(index)
+        if worker is not None:
+            self.workers[index] = worker
+            print(f"👷 Worker {index} serving (pid {worker.process.pid})")
+        return worker
+
+    def reload(self):
+        """Replace the workers one at a time without closing the port"""
+        print("🔄 Reloading workers...")
+        for index in sorted(self.workers):
+            old = self.workers[index]
+            if self.start_worker(index) is None:
+                print("❌ Reload stopped; the remaining workers keep running")
+                self.workers[index] = old
+                return
+            self.stop_worker(old.process)
+        print("✅ Reload complete")
+
+    def reap(self):
+        """Restart workers that exited on their own"""
+        for index, worker in list(self.workers.items()):
+            code = worker.process.poll()
+            if code is None:
+                continue
+            del self.workers[index]
+            uptime = time.monotonic() - worker.started
+            delay = 0.0
+            if uptime < MIN_UPTIME:
+                # Crashing on start; don't spin
+                delay = min(MAX_RESTART_DELAY, max(1.0, self._restart_delay.get(index, 0) * 2))
+            self._restart_delay[index] = delay
+            print(f"💥 Worker {index} exited with status {code}; restarting"
+                  + (f" in {delay:.0f}s" if delay else ""))
+            self._restart_at[index] = time.monotonic() + delay
+
+    def restart_due(self):
+        now = time.monotonic()
+        for index, when in list(self._restart_at.items()):
+            if when > now:
+                continue
+            del self._restart_at[index]
+            if self.start_worker(index) is None:
+                # A worker that can't start is crashing on start
+                delay = min(MAX_RESTART_DELAY, max(1.0, self._restart_delay.get(index, 0) * 2))
+                self._restart_delay[index] = delay
+                self._restart_at[index] = time.monotonic() + delay
+
+    def run(self):
+        def request_stop(signum, frame):
+            self._stopping = True
+
+        def request_reload(signum, frame):
+            self._reload = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        for index in range(self.processes):
+            self._restart_at[index] = 0.0
+        self.restart_due()
+        print(f"🧑‍✈️ Supervisor pid {os.getpid()}: SIGHUP reloads, SIGTERM stops")
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            self.reap()
+            self.restart_due()
+            time.sleep(0.2)
+
+        print("\n🛑 Shutting down, draining workers...")
+        for worker in self.workers.values():
+            if worker.process.poll() is None:
+                worker.process.send_signal(signal.SIGTERM)
+        for worker in self.workers.values():
+            self.stop_worker(worker.process)
+        print("👋 All workers stopped.")
@@ -0,0 +1,190 @@
+"""Sampled profiling for the server and the game engine.
+
+``Profiler.sample(name)`` wraps a unit of work: a request or an engine call.
+A random ``sample_rate`` fraction of them run under cProfile, and while a
+sample is running, ``span(name)`` blocks anywhere on the same thread
+record how long they took:
+
+    with profiler.sample('POST /api/save-progress'):
+        with span('json.decode'):
+            save_data = json.loads(body)
+
+``dump()`` writes what has been collected to a directory:
+
+- ``profile-*.pstats``: the merged cProfile statistics. Open them with
+  ``python -m pstats``, snakeviz or similar;
+- ``spans-*.folded``: span self-times in microseconds as collapsed stacks
+  (``sample;span;span value``), ready for flamegraph.pl or speedscope.
+
+Outside a sample, ``span`` returns a shared no-op, and ``NullProfiler`` does
+the same for ``sample``, so instrumented code costs next to nothing when
+profiling is off.
+"""
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+from collections import Counter
+
+# The sample running on this thread, if any
+_local = threading.local()
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL = _NullContext()
+
+
+def span(name):
+    """Time a block as part of the current sample; free when there is none"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _NULL
+    return _Span(trace, name)
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started', 'children')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.children = 0.0
+        self.trace.stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        stack = self.trace.stack
+        path = ';'.join(entry.name for entry in stack)
+        stack.pop()
+        # Folded stacks carry self time; the parent's excludes this span
+        self.trace.folded[path] += (elapsed - self.children) * 1e6
+        if stack:
+            stack[-1].children += elapsed
+
+
+class _Trace:
+    __slots__ = ('stack', 'folded')
+
+    def __init__(self):
+        self.stack = []
+        self.folded = Counter()
+
+
+class _Sample:
+    __slots__ = ('profiler', 'name', 'profile', 'trace', 'root')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _local.trace = _Trace()
+        self.root = _Span(self.trace, self.name).__enter__()
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler owns this thread; keep the spans anyway
+            self.profile = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.disable()
+        self.root.__exit__(exc_type, exc, tb)
+        _local.trace = None
+        self.profiler._collect(self.name, self.profile, self.trace.folded)
+
+
+class Profiler:
+    """Profiles a sample_rate fraction of the work passed to sample()"""
+    enabled = True
+
+    def __init__(self, directory='profiles', sample_rate=0.01):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Caller holds self._lock (or is __init__)
+        self._stats = None
+        self._folded = Counter()
+        self._samples = Counter()
+
+    def sample(self, name):
+        """Context manager that profiles its block if this one is sampled"""
+        if getattr(_local, 'trace', None) is not None:
+            # Already inside a sample on this thread: just a span of it
+            return span(name)
+        if random.random() >= self.sample_rate:
+            return _NULL
+        return _Sample(self, name)
+
+    def _collect(self, name, profile, folded):
+        stats = None
+        if profile is not None:
+            stats = pstats.Stats(profile)
+        with self._lock:
+            self._samples[name] += 1
+            self._folded.update(folded)
+            if stats is not None:
+                if self._stats is None:
+                    self._stats = stats
+                else:
+                    self._stats.add(stats)
+
+    def stats(self):
+        with self._lock:
+            return {'samples': sum(self._samples.values()),
+                    'by_name': dict(self._samples)}
+
+    def dump(self):
+        """Write what has been collected and start afresh. Returns the paths written"""
+        with self._lock:
+            stats, folded = self._stats, self._folded
+            self._reset()
+        if stats is None and not folded:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        paths = []
+        if stats is not None:
+            path = os.path.join(self.directory, f"profile-{stamp}.pstats")
+            stats.dump_stats(path)
+            paths.append(path)
+        if folded:
+            path = os.path.join(self.directory, f"spans-{stamp}.folded")
+            with open(path, 'w') as f:
+                for stack, micros in sorted(folded.items()):
+                    f.write(f"{stack} {max(1, round(micros))}\n")
+            paths.append(path)
+        return paths
+
+
+class NullProfiler:
+    """A Profiler that never samples"""
+    enabled = False
+    directory = None
+
+    def sample(self, name):
+        return _NULL
+
+    def stats(self):
+        return {'samples': 0, 'by_name': {}}
+
+    def dump(self):
+        return []
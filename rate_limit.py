@@ -0,0 +1,119 @@
+"""Rate limiting and load shedding.
+
+``TokenBucketLimiter`` gives every key (a player uid or client IP) a token
+bucket refilled at ``rate`` tokens per second up to ``burst``. Buckets live in
+an LRU bounded by ``max_keys``; an evicted key simply starts again with a
+full bucket, so memory stays flat however many clients show up.
+
+``AdmissionController`` protects the server as a whole: saves are shed while
+the write-behind backlog is too deep, and payment calls while Stripe's recent
+latency is too high. While shedding payments it still lets one probe request
+through per ``probe_interval`` so it notices when Stripe recovers.
+
+Both report how long the caller should wait, for a Retry-After header.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets kept in a bounded LRU"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill time]
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'limited': 0, 'evicted': 0}
+
+    def acquire(self, key, cost=1.0):
+        """Take cost tokens from key's bucket.
+
+        Returns 0 if allowed, otherwise the seconds until enough tokens will
+        have accumulated.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self._counters['evicted'] += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self._counters['allowed'] += 1
+                return 0
+            self._counters['limited'] += 1
+            return (cost - bucket[0]) / self.rate
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['keys'] = len(self._buckets)
+        return stats
+
+
+def retry_after_header(seconds):
+    """Retry-After takes whole seconds; never tell a client to retry at 0"""
+    return str(max(1, math.ceil(seconds)))
+
+
+class AdmissionController:
+    """Sheds saves and payment calls when the server is falling behind"""
+
+    def __init__(self, save_backlog=None, max_pending_saves=20000,
+                 stripe_latency_limit=3.0, probe_interval=1.0, retry_after=2.0):
+        # save_backlog is a callable returning how many saves await writing
+        self.save_backlog = save_backlog
+        self.max_pending_saves = max_pending_saves
+        self.stripe_latency_limit = stripe_latency_limit
+        self.probe_interval = probe_interval
+        self.retry_after = retry_after
+        self.stripe_latency = 0.0  # exponentially weighted moving average
+        self._next_probe = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'shed_saves': 0, 'shed_payments': 0}
+
+    def record_stripe_latency(self, seconds):
+        with self._lock:
+            self.stripe_latency = 0.8 * self.stripe_latency + 0.2 * seconds
+
+    def admit_save(self):
+        """0 to accept a save, otherwise seconds the client should wait"""
+        if (self.save_backlog is None or not self.max_pending_saves
+                or self.save_backlog() < self.max_pending_saves):
+            return 0
+        with self._lock:
+            self._counters['shed_saves'] += 1
+        return self.retry_after
+
+    def admit_payment(self):
+        """0 to accept a call that reaches Stripe, otherwise seconds to wait"""
+        if not self.stripe_latency_limit:
+            return 0
+        with self._lock:
+            if self.stripe_latency < self.stripe_latency_limit:
+                return 0
+            now = time.monotonic()
+            if now >= self._next_probe:
+                self._next_probe = now + self.probe_interval
+                return 0
+            self._counters['shed_payments'] += 1
+        return self.retry_after
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['stripe_latency_seconds'] = round(self.stripe_latency, 4)
+        stats['save_backlog'] = self.save_backlog() if self.save_backlog else 0
+        return stats
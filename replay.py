@@ -0,0 +1,226 @@
+"""Deterministic replay logs.
+
+The engine draws every random number from one seeded ``random.Random``, so a
+session is fully described by its seed and the choices the player made. A
+replay log stores exactly that as compact binary:
+
+    b'WLR' version:u8 seed:zigzag-varint  entry*
+
+where each entry is a varint code:
+
+    0  new game, followed by the player's name (varint length + UTF-8)
+    1  a choice that isn't one of the decision's options, followed by its text
+    n  option n - 2 of the pending decision
+
+A typical turn costs one or two bytes. ``Replayer`` feeds a log back through
+the rules at full speed and keeps periodic snapshots so ``seek`` can jump to
+any point without replaying from the start.
+"""
+import bisect
+import random
+
+import game_engine
+
+MAGIC = b'WLR'
+VERSION = 1
+
+NEW_GAME = 0
+TEXT_CHOICE = 1
+FIRST_OPTION = 2
+
+
+def write_varint(out, value):
+    """Append an unsigned LEB128 varint to a bytearray"""
+    if value < 0:
+        raise ValueError("varints are unsigned")
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    """Decode a varint at data[pos]; return (value, next position)"""
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def _write_text(out, text):
+    encoded = text.encode('utf-8')
+    write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_text(data, pos):
+    length, pos = read_varint(data, pos)
+    if pos + length > len(data):
+        raise ValueError("truncated string")
+    return bytes(data[pos:pos + length]).decode('utf-8'), pos + length
+
+
+class ReplayLog:
+    """A seed and the session's entries: ('game', name), ('option', i) or ('text', s)"""
+
+    def __init__(self, seed, entries=None):
+        self.seed = seed
+        self.entries = entries if entries is not None else []
+
+    def encode(self):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        write_varint(out, _zigzag(self.seed))
+        for kind, value in self.entries:
+            _encode_entry(out, kind, value)
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a replay log")
+        if data[len(MAGIC)] != VERSION:
+            raise ValueError(f"unsupported replay log version {data[len(MAGIC)]}")
+        seed, pos = read_varint(data, len(MAGIC) + 1)
+        log = cls(_unzigzag(seed))
+        while pos < len(data):
+            code, pos = read_varint(data, pos)
+            if code == NEW_GAME:
+                name, pos = _read_text(data, pos)
+                log.entries.append(('game', name))
+            elif code == TEXT_CHOICE:
+                text, pos = _read_text(data, pos)
+                log.entries.append(('text', text))
+            else:
+                log.entries.append(('option', code - FIRST_OPTION))
+        return log
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _encode_entry(out, kind, value):
+    if kind == 'game':
+        write_varint(out, NEW_GAME)
+        _write_text(out, value)
+    elif kind == 'text':
+        write_varint(out, TEXT_CHOICE)
+        _write_text(out, value)
+    else:
+        write_varint(out, value + FIRST_OPTION)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return ReplayLog.decode(f.read())
+
+
+class ReplayWriter:
+    """Appends a session to a log file as it is played"""
+
+    def __init__(self, path, seed):
+        self.log = ReplayLog(seed)
+        self._file = open(path, 'wb')
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        write_varint(header, _zigzag(seed))
+        self._write(header)
+
+    def _write(self, data):
+        # Flush every entry so a crash still leaves a replayable log
+        self._file.write(data)
+        self._file.flush()
+
+    def _append(self, kind, value):
+        self.log.entries.append((kind, value))
+        out = bytearray()
+        _encode_entry(out, kind, value)
+        self._write(out)
+
+    def new_game(self, player_name):
+        self._append('game', player_name)
+
+    def choice(self, decision, choice):
+        if choice in decision.options:
+            self._append('option', decision.options.index(choice))
+        else:
+            self._append('text', choice)
+
+    def close(self):
+        self._file.close()
+
+
+class Replayer:
+    """Re-runs a ReplayLog through the engine, with snapshots for seeking.
+
+    position is the number of entries applied so far. After each entry the
+    next turn is started automatically, exactly as the CLI does, so state is
+    always waiting on a decision, over, or None before the first game.
+    """
+
+    def __init__(self, log, snapshot_every=256):
+        self.log = log
+        self.snapshot_every = snapshot_every
+        self.rng = random.Random(log.seed)
+        self.state = None
+        self.position = 0
+        self._snapshot_positions = [0]
+        self._snapshots = [(None, self.rng.getstate())]
+
+    def step(self):
+        """Apply the next entry and return the events it produced"""
+        kind, value = self.log.entries[self.position]
+        events = []
+        if kind == 'game':
+            self.state = game_engine.new_game(value)
+        else:
+            if self.state is None or self.state.pending is None:
+                raise ValueError(f"entry {self.position} answers a decision that isn't pending")
+            choice = self.state.pending.options[value] if kind == 'option' else value
+            self.state, events = game_engine.step(self.state, choice, self.rng)
+        if self.state.pending is None and not self.state.game_over:
+            self.state, turn_events = game_engine.start_turn(self.state, self.rng)
+            events += turn_events
+        self.position += 1
+        if (self.position % self.snapshot_every == 0
+                and self.position > self._snapshot_positions[-1]):
+            self._snapshot_positions.append(self.position)
+            self._snapshots.append((self.state.copy(), self.rng.getstate()))
+        return events
+
+    def run(self, observer=None):
+        """Replay to the end of the log and return the final state"""
+        while self.position < len(self.log):
+            events = self.step()
+            if observer:
+                observer(events)
+        return self.state
+
+    def seek(self, position):
+        """Move to just after entry position - 1 and return the state there"""
+        if not 0 <= position <= len(self.log):
+            raise IndexError(f"position {position} outside 0..{len(self.log)}")
+        if position < self.position or position - self.position > self.snapshot_every:
+            index = bisect.bisect_right(self._snapshot_positions, position) - 1
+            if self._snapshot_positions[index] > self.position or position < self.position:
+                state, rng_state = self._snapshots[index]
+                self.state = state.copy() if state is not None else None
+                self.rng.setstate(rng_state)
+                self.position = self._snapshot_positions[index]
+        while self.position < position:
+            self.step()
+        return self.state
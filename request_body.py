@@ -0,0 +1,132 @@
+"""Reading request bodies with a size cap and an overall deadline.
+
+BaseHTTPRequestHandler leaves the body on the socket for the handler to
+read. ``read_body`` reads it, framed either by Content-Length or by chunked
+transfer encoding, a bounded piece at a time. A client therefore can't make
+a worker buffer more than ``max_size`` bytes, and can't hold the worker past
+``timeout`` seconds by trickling bytes in: every socket read only waits for
+whatever is left of the deadline.
+
+The body comes back as a bytearray, which ``json.loads`` parses directly.
+"""
+import socket
+import string
+import time
+
+# Most bytes taken from the socket per read
+READ_SIZE = 64 * 1024
+# Longest chunk-size or trailer line accepted in a chunked body
+MAX_LINE = 1024
+
+_HEX_DIGITS = frozenset(string.hexdigits.encode('ascii'))
+
+
+class BodyError(Exception):
+    """The body couldn't be read; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _BodyReader:
+    def __init__(self, rfile, connection, timeout):
+        self.rfile = rfile
+        self.connection = connection
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def _arm(self):
+        # Each socket read may only wait for what is left of the deadline
+        if self.deadline is None or self.connection is None:
+            return
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise BodyError(408, "Timed out reading request body")
+        self.connection.settimeout(remaining)
+
+    def _read(self, method, *args):
+        self._arm()
+        try:
+            data = method(*args)
+        except socket.timeout:
+            raise BodyError(408, "Timed out reading request body")
+        if not data:
+            raise BodyError(400, "Request body ended early")
+        return data
+
+    def read_exact(self, length):
+        body = bytearray(length)
+        view = memoryview(body)
+        pos = 0
+        while pos < length:
+            # readinto1 makes at most one socket read, so the deadline is
+            # checked between reads however slowly the bytes arrive
+            pos += self._read(self.rfile.readinto1, view[pos:pos + READ_SIZE])
+        view.release()
+        return body
+
+    def read_line(self):
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            # peek makes at most one socket read and returns what is buffered
+            buffered = self._read(self.rfile.peek, 1)
+            end = buffered.find(b'\n')
+            take = len(buffered) if end < 0 else end + 1
+            line += self.rfile.read(min(take, MAX_LINE + 1 - len(line)))
+            if len(line) > MAX_LINE:
+                raise BodyError(400, "Chunked body line too long")
+        return bytes(line).rstrip(b'\r\n')
+
+    def read_chunked(self, max_size):
+        body = bytearray()
+        while True:
+            size_text = self.read_line().split(b';', 1)[0].strip()
+            if not size_text or not _HEX_DIGITS.issuperset(size_text):
+                raise BodyError(400, "Invalid chunk size")
+            size = int(size_text, 16)
+            if size == 0:
+                break
+            if len(body) + size > max_size:
+                raise BodyError(413, f"Request body larger than {max_size} bytes")
+            while size:
+                data = self._read(self.rfile.read1, min(size, READ_SIZE))
+                body += data
+                size -= len(data)
+            if self.read_line():
+                raise BodyError(400, "Chunk data longer than its size")
+        # Trailer fields are read and ignored, up to the blank line
+        while self.read_line():
+            pass
+        return body
+
+
+def read_body(rfile, headers, max_size, timeout=None, connection=None):
+    """Read a request body of at most max_size bytes within timeout seconds.
+
+    Returns None if the request carries neither Content-Length nor
+    Transfer-Encoding, i.e. has no body. Raises BodyError if the body is too
+    large, malformed or too slow. connection's timeout is restored afterwards.
+    """
+    transfer_encoding = headers.get('Transfer-Encoding')
+    content_length = headers.get('Content-Length')
+    if transfer_encoding is None and content_length is None:
+        return None
+
+    previous_timeout = connection.gettimeout() if connection is not None else None
+    reader = _BodyReader(rfile, connection, timeout)
+    try:
+        if transfer_encoding is not None:
+            # Transfer-Encoding wins over Content-Length when both are sent
+            if transfer_encoding.strip().lower() != 'chunked':
+                raise BodyError(501, f"Unsupported Transfer-Encoding {transfer_encoding!r}")
+            return reader.read_chunked(max_size)
+        content_length = content_length.strip()
+        if not (content_length.isascii() and content_length.isdigit()):
+            raise BodyError(400, "Invalid Content-Length")
+        length = int(content_length)
+        if length > max_size:
+            raise BodyError(413, f"Request body larger than {max_size} bytes")
+        return reader.read_exact(length)
+    finally:
+        if connection is not None:
+            connection.settimeout(previous_timeout)
@@ -0,0 +1,320 @@
+"""Compact, versioned save encoding and save deltas.
+
+Stored saves are a two byte header followed by a MessagePack body:
+
+    0xc1  schema-version:u8  msgpack(save)
+
+0xc1 is a byte MessagePack never uses and JSON can't start with, so saves
+written before this format (plain JSON) are recognised and loaded as schema
+version 1. Older saves are brought up to date by ``MIGRATIONS`` on read.
+
+The ``msgpack`` package is used when installed; otherwise a pure-Python
+encoder for the same subset (nil, bools, ints, floats, strings, arrays and
+maps) writes identical bytes.
+
+``apply_patch`` applies the JSON-patch style operations sent to
+/api/save-delta, so clients only upload the fields that changed.
+"""
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MARKER = 0xc1
+SCHEMA_VERSION = 2
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else []
+
+
+def normalize(save_data):
+    """Return save_data with the v2 invariants, copying it only if they don't hold.
+
+    v2 saves always have an integer saveRevision, used to check deltas
+    against the stored copy, and store supplies and purchases as lists.
+    """
+    revision = save_data.get('saveRevision')
+    if (isinstance(revision, int) and not isinstance(revision, bool)
+            and isinstance(save_data.get('supplies'), list)
+            and isinstance(save_data.get('premiumPurchases'), list)):
+        return save_data
+    save_data = dict(save_data)
+    if not isinstance(revision, int) or isinstance(revision, bool):
+        save_data['saveRevision'] = 0
+    save_data['supplies'] = _as_list(save_data.get('supplies'))
+    save_data['premiumPurchases'] = _as_list(save_data.get('premiumPurchases'))
+    return save_data
+
+
+def next_revision(stored):
+    """The saveRevision of a save written over stored (None if there is none)"""
+    revision = stored.get('saveRevision') if isinstance(stored, dict) else None
+    if not isinstance(revision, int) or isinstance(revision, bool):
+        revision = 0
+    return revision + 1
+
+
+def _migrate_v1(save_data):
+    return normalize(save_data)
+
+
+# schema version -> function upgrading a save from that version to the next
+MIGRATIONS = {
+    1: _migrate_v1,
+}
+
+
+def migrate(save_data, version):
+    """Upgrade a save dict from the given schema version to SCHEMA_VERSION"""
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"save schema version {version} is newer than this server")
+    while version < SCHEMA_VERSION:
+        save_data = MIGRATIONS[version](save_data)
+        version += 1
+    return save_data
+
+
+def encode_save(save_data):
+    """Encode a save dict, normalized to the current schema, for storage"""
+    return bytes((MARKER, SCHEMA_VERSION)) + pack(normalize(save_data))
+
+
+def validate_save(save_data):
+    """Raise ValueError if encode_save can't store save_data.
+
+    The routes that accept saves call this before answering, since a
+    buffered save isn't encoded until after the client has its 200.
+    """
+    try:
+        encode_save(save_data)
+    except (TypeError, OverflowError, RecursionError) as e:
+        # msgpack raises these for out of range ints and deep nesting
+        raise ValueError(str(e) or type(e).__name__) from None
+
+
+def decode_save(blob):
+    """Decode a stored save in either format, migrated to the current schema"""
+    if isinstance(blob, str):
+        blob = blob.encode('utf-8')
+    if blob[:1] == b'\xc1':
+        version = blob[1]
+        save_data = unpack(blob[2:])
+    else:
+        version = 1
+        save_data = json.loads(blob)
+    return migrate(save_data, version)
+
+
+def pack(obj):
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def unpack(data):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    obj, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise ValueError("trailing bytes after save")
+    return obj
+
+
+def _pack_length(out, length, fix_base, fix_limit, codes):
+    if length < fix_limit:
+        out.append(fix_base | length)
+    elif length < 0x10000 and codes[0] is not None:
+        out.append(codes[0])
+        out += struct.pack('>H', length)
+    else:
+        out.append(codes[1])
+        out += struct.pack('>I', length)
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif obj > 0:
+            for code, fmt, limit in ((0xcc, '>B', 1 << 8), (0xcd, '>H', 1 << 16),
+                                     (0xce, '>I', 1 << 32), (0xcf, '>Q', 1 << 64)):
+                if obj < limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise ValueError("integer too large to pack")
+        else:
+            for code, fmt, limit in ((0xd0, '>b', 1 << 7), (0xd1, '>h', 1 << 15),
+                                     (0xd2, '>i', 1 << 31), (0xd3, '>q', 1 << 63)):
+                if obj >= -limit:
+                    out.append(code)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise ValueError("integer too large to pack")
+    elif isinstance(obj, float):
+        out.append(0xcb)
+        out += struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        encoded = obj.encode('utf-8')
+        length = len(encoded)
+        if length < 32:
+            out.append(0xa0 | length)
+        elif length < 0x100:
+            out.append(0xd9)
+            out.append(length)
+        else:
+            _pack_length(out, length, 0, 0, (0xda, 0xdb))
+        out += encoded
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(out, len(obj), 0x90, 16, (0xdc, 0xdd))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        _pack_length(out, len(obj), 0x80, 16, (0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"can't pack {type(obj).__name__}")
+
+
+_FIXED = {
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+}
+_LENGTHS = {
+    0xd9: ('>B', 1), 0xda: ('>H', 2), 0xdb: ('>I', 4),
+    0xdc: ('>H', 2), 0xdd: ('>I', 4), 0xde: ('>H', 2), 0xdf: ('>I', 4),
+}
+
+
+def _unpack(data, pos):
+    if pos >= len(data):
+        raise ValueError("truncated save")
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code == 0xc0:
+        return None, pos
+    if code == 0xc2:
+        return False, pos
+    if code == 0xc3:
+        return True, pos
+    if code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, pos)[0], pos + size
+    if code in _LENGTHS:
+        fmt, size = _LENGTHS[code]
+        length = struct.unpack_from(fmt, data, pos)[0]
+        pos += size
+    else:
+        length = code & (0x1f if 0xa0 <= code < 0xc0 else 0x0f)
+
+    if 0xa0 <= code < 0xc0 or code in (0xd9, 0xda, 0xdb):
+        end = pos + length
+        if end > len(data):
+            raise ValueError("truncated save")
+        return bytes(data[pos:end]).decode('utf-8'), end
+    if 0x90 <= code < 0xa0 or code in (0xdc, 0xdd):
+        items = []
+        for _ in range(length):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    if 0x80 <= code < 0x90 or code in (0xde, 0xdf):
+        obj = {}
+        for _ in range(length):
+            key, pos = _unpack(data, pos)
+            obj[key], pos = _unpack(data, pos)
+        return obj, pos
+    raise ValueError(f"unsupported type code 0x{code:02x} in save")
+
+
+def _parse_pointer(path):
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise ValueError(f"invalid path {path!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in path[1:].split('/')]
+
+
+def _child_key(container, token, op):
+    if isinstance(container, dict):
+        return token
+    if isinstance(container, list):
+        if token == '-' and op == 'add':
+            return len(container)
+        if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+            raise ValueError(f"invalid array index {token!r}")
+        index = int(token)
+        if index > len(container) or (index == len(container) and op != 'add'):
+            raise ValueError(f"array index {index} out of range")
+        return index
+    raise ValueError("path runs through a value that isn't an object or array")
+
+
+def apply_patch(document, ops):
+    """Apply add/replace/remove operations and return the patched document.
+
+    document is never modified; only the containers along each patched path
+    are copied, so unchanged parts are shared with the original.
+    """
+    if not isinstance(ops, list):
+        raise ValueError("ops must be a list")
+    document = dict(document)
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("each op must be an object")
+        kind = op.get('op')
+        if kind not in ('add', 'replace', 'remove'):
+            raise ValueError(f"unsupported op {kind!r}")
+        if kind != 'remove' and 'value' not in op:
+            raise ValueError(f"{kind} needs a value")
+        tokens = _parse_pointer(op.get('path'))
+
+        parent = document
+        for token in tokens[:-1]:
+            key = _child_key(parent, token, 'replace')
+            if isinstance(parent, dict) and key not in parent:
+                raise ValueError(f"path {op['path']!r} does not exist")
+            child = parent[key]
+            if isinstance(child, dict):
+                child = dict(child)
+            elif isinstance(child, list):
+                child = list(child)
+            parent[key] = child
+            parent = child
+
+        key = _child_key(parent, tokens[-1], kind)
+        if isinstance(parent, dict):
+            if kind != 'add' and key not in parent:
+                raise ValueError(f"path {op['path']!r} does not exist")
+            if kind == 'remove':
+                del parent[key]
+            else:
+                parent[key] = op['value']
+        elif kind == 'add':
+            parent.insert(key, op['value'])
+        elif kind == 'replace':
+            parent[key] = op['value']
+        else:
+            del parent[key]
+    return document
@@ -0,0 +1,350 @@
+"""Per-player save storage.
+
+Saves are keyed by the ``playerUID`` the web client generates. Two backends
+are available:
+
+* ``ShardedFileSaveStore`` keeps one file per player, spread over a
+  two-level directory tree so no single directory grows without bound.
+* ``SQLiteSaveStore`` keeps every save in one SQLite database in WAL mode.
+
+Both do O(1) lookups by player and write atomically, so a crash mid-write
+never leaves a torn save behind. Saves are stored in the compact
+``save_codec`` format; JSON saves written by older versions still load.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from save_codec import decode_save, encode_save
+from sqlite_connections import ThreadLocalConnections
+
+# Failures of the store itself, as opposed to a save it can't hold; worth
+# retrying the same writes later
+STORE_ERRORS = (OSError, sqlite3.OperationalError)
+
+MAX_PLAYER_UID_LENGTH = 128
+
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_CHUNK = 500
+
+
+def valid_player_uid(player_uid):
+    """Return True if player_uid is usable as a save key"""
+    return (isinstance(player_uid, str)
+            and 0 < len(player_uid) <= MAX_PLAYER_UID_LENGTH
+            and player_uid.isprintable())
+
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SaveStore:
+    """Interface shared by the save backends"""
+
+    def get(self, player_uid):
+        """Return the save for player_uid, or None if there isn't one"""
+        raise NotImplementedError
+
+    def get_many(self, player_uids):
+        """Return {player_uid: save or None} for every requested uid"""
+        return {player_uid: self.get(player_uid) for player_uid in player_uids}
+
+    def put(self, player_uid, save_data):
+        """Store save_data for player_uid, replacing any previous save"""
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """Store several (player_uid, save_data) pairs"""
+        for player_uid, save_data in items:
+            self.put(player_uid, save_data)
+
+    def delete(self, player_uid):
+        """Remove the save for player_uid. Returns True if one existed"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ShardedFileSaveStore(SaveStore):
+    """One file per player under root/ab/cd/<sha1>.sav"""
+
+    def __init__(self, root='saves', fsync=True, read_threads=8):
+        self.root = root
+        self.fsync = fsync
+        self.read_threads = read_threads
+        self._readers = None
+        self._readers_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, player_uid, suffix='.sav'):
+        # Hashing keeps arbitrary uids out of the filesystem namespace and
+        # spreads players evenly across shards.
+        digest = hashlib.sha1(player_uid.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + suffix)
+
+    def get(self, player_uid):
+        # Saves from before the compact format are <sha1>.json
+        for suffix in ('.sav', '.json'):
+            try:
+                with open(self._path(player_uid, suffix), 'rb') as f:
+                    return decode_save(f.read())
+            except FileNotFoundError:
+                pass
+        return None
+
+    def get_many(self, player_uids):
+        # Each save is its own file, so the reads overlap on a small pool
+        # instead of waiting on the disk one at a time
+        player_uids = list(player_uids)
+        if len(player_uids) < 2 or self.read_threads < 2:
+            return super().get_many(player_uids)
+        if self._readers is None:
+            with self._readers_lock:
+                if self._readers is None:
+                    self._readers = ThreadPoolExecutor(self.read_threads,
+                                                       thread_name_prefix='save-read')
+        return dict(zip(player_uids, self._readers.map(self.get, player_uids)))
+
+    def put(self, player_uid, save_data):
+        self.put_many([(player_uid, save_data)])
+
+    def put_many(self, items):
+        # Write every temp file before renaming any of them, then fsync each
+        # touched shard directory once, so a batch pays far fewer directory
+        # syncs than one put per save.
+        staged = []
+        try:
+            for player_uid, save_data in items:
+                path = self._path(player_uid)
+                directory = os.path.dirname(path)
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+                staged.append((tmp_path, path))
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(encode_save(save_data))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            self._replace_all(staged)
+            staged = []
+        finally:
+            for tmp_path, _ in staged:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+
+    def _replace_all(self, staged):
+        """Rename the staged files into place, all of them or none"""
+        # A batch of several keeps a hard link to each save it replaces until
+        # every rename has gone through, so a failure can put them back
+        keep_old = len(staged) > 1
+        applied = []  # (path, link to the previous save or None)
+        try:
+            for tmp_path, path in staged:
+                old_path = None
+                if keep_old:
+                    old_path = tmp_path + '.old'
+                    try:
+                        os.link(path, old_path)
+                    except FileNotFoundError:
+                        old_path = None
+                try:
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if old_path is not None:
+                        os.unlink(old_path)
+                    raise
+                applied.append((path, old_path))
+        except BaseException:
+            for path, old_path in reversed(applied):
+                if old_path is not None:
+                    os.replace(old_path, path)
+                else:
+                    os.unlink(path)
+            raise
+        directories = set()
+        for path, old_path in applied:
+            if old_path is not None:
+                os.unlink(old_path)
+            # The new save supersedes any old-format JSON file
+            self._remove_legacy(path)
+            directories.add(os.path.dirname(path))
+        if self.fsync:
+            for directory in directories:
+                _fsync_directory(directory)
+
+    @staticmethod
+    def _remove_legacy(path):
+        try:
+            os.remove(path[:-len('.sav')] + '.json')
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete(self, player_uid):
+        path = self._path(player_uid)
+        removed = self._remove_legacy(path)
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return removed
+
+    def close(self):
+        if self._readers is not None:
+            self._readers.shutdown()
+
+
+class SQLiteSaveStore(SaveStore):
+    """All saves in a single SQLite database using write-ahead logging"""
+
+    def __init__(self, path='wasteland_saves.db'):
+        self.path = path
+        self._connections = ThreadLocalConnections(path)
+        self._connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS saves ("
+            " player_uid TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def _conn(self):
+        return self._connections.get()
+
+    def get(self, player_uid):
+        row = self._conn().execute(
+            "SELECT data FROM saves WHERE player_uid = ?", (player_uid,)
+        ).fetchone()
+        # Rows written before the compact format hold JSON text
+        return decode_save(row[0]) if row else None
+
+    def get_many(self, player_uids):
+        result = dict.fromkeys(player_uids)
+        uids = list(result)
+        conn = self._conn()
+        for start in range(0, len(uids), _LOOKUP_CHUNK):
+            chunk = uids[start:start + _LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f"SELECT player_uid, data FROM saves WHERE player_uid IN ({placeholders})",
+                chunk,
+            )
+            for player_uid, data in rows:
+                result[player_uid] = decode_save(data)
+        return result
+
+    def put(self, player_uid, save_data):
+        self.put_many([(player_uid, save_data)])
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(player_uid, encode_save(save_data), now) for player_uid, save_data in items]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO saves (player_uid, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(player_uid) DO UPDATE SET data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def delete(self, player_uid):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM saves WHERE player_uid = ?", (player_uid,))
+        return cursor.rowcount > 0
+
+    def close(self):
+        self._connections.close_all()
+
+
+class InstrumentedSaveStore(SaveStore):
+    """Wraps a store and records how long each operation takes"""
+
+    def __init__(self, store, registry):
+        self.store = store
+        self._seconds = registry.histogram(
+            'wasteland_save_io_seconds', "Save store operation latency", ('op',))
+        self._saves = registry.counter(
+            'wasteland_save_io_saves_total', "Saves written by the save store")
+        self._errors = registry.counter(
+            'wasteland_save_io_errors_total', "Save store operations that raised", ('op',))
+
+    def _timed(self, op, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        except Exception:
+            self._errors.inc(op)
+            raise
+        finally:
+            self._seconds.observe(time.perf_counter() - started, op)
+
+    def get(self, player_uid):
+        return self._timed('get', self.store.get, player_uid)
+
+    def get_many(self, player_uids):
+        return self._timed('get_many', self.store.get_many, player_uids)
+
+    def put(self, player_uid, save_data):
+        self._saves.inc()
+        return self._timed('put', self.store.put, player_uid, save_data)
+
+    def put_many(self, items):
+        items = list(items)
+        self._saves.inc(amount=len(items))
+        return self._timed('put_many', self.store.put_many, items)
+
+    def delete(self, player_uid):
+        return self._timed('delete', self.store.delete, player_uid)
+
+    def close(self):
+        self.store.close()
+
+
+BACKENDS = {
+    'files': ShardedFileSaveStore,
+    'sqlite': SQLiteSaveStore,
+}
+
+
+def open_save_store(backend='files', path=None):
+    """Create a save store by backend name ('files' or 'sqlite')"""
+    try:
+        store_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown save backend: {backend!r}")
+    return store_class(path) if path else store_class()
+
+
+def migrate_legacy_save(store, path='wasteland_save.json'):
+    """Move the old single global save file into the store.
+
+    The file is renamed to <path>.migrated afterwards so this only runs once.
+    Returns the player uid the save was stored under, or None.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        save_data = json.load(f)
+    player_uid = save_data.get('playerUID')
+    if not valid_player_uid(player_uid):
+        player_uid = 'legacy_player'
+    if store.get(player_uid) is None:
+        store.put(player_uid, save_data)
+    os.replace(path, path + '.migrated')
+    return player_uid
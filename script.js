@@ -18,6 +18,10 @@ class WastelandSurvival {
         this.saveKey = "wasteland_save_data";
         this.currentMission = null;
         this.missionProgress = 0;
+        // Revision and per-field JSON of the copy stored on the server, so
+        // later saves only upload the fields that changed
+        this.saveRevision = 0;
+        this.savedFields = null;
         
         // NEW FEATURES
         this.gameMode = "normal"; // normal, hardcore, creative
@@ -74,6 +78,11 @@ class WastelandSurvival {
         };
 
         try {
+            if (await this.saveDelta(saveData)) {
+                this.addLog("💾 Progress saved to cloud", 'success');
+                return;
+            }
+
             const response = await fetch('/api/save-progress', {
                 method: 'POST',
                 headers: {
@@ -83,6 +92,10 @@ class WastelandSurvival {
             });
 
             if (response.ok) {
+                // The server numbers revisions; later deltas are based on its number
+                const result = await response.json();
+                this.saveRevision = result.revision;
+                this.savedFields = this.fieldSnapshot(saveData);
                 this.addLog("💾 Progress saved to cloud", 'success');
             } else {
                 // Fallback to localStorage if cloud save fails
@@ -96,13 +109,67 @@ class WastelandSurvival {
         }
     }
 
+    fieldSnapshot(saveData) {
+        const fields = {};
+        for (const [key, value] of Object.entries(saveData)) {
+            if (key !== 'saveRevision') {
+                fields[key] = JSON.stringify(value);
+            }
+        }
+        return fields;
+    }
+
+    async saveDelta(saveData) {
+        // Send only changed fields; false means a full save is needed
+        if (!this.savedFields) {
+            return false;
+        }
+        const fields = this.fieldSnapshot(saveData);
+        const ops = [];
+        for (const [key, json] of Object.entries(fields)) {
+            if (this.savedFields[key] !== json) {
+                const op = key in this.savedFields ? 'replace' : 'add';
+                ops.push({ op: op, path: '/' + key, value: saveData[key] });
+            }
+        }
+        for (const key of Object.keys(this.savedFields)) {
+            if (!(key in fields)) {
+                ops.push({ op: 'remove', path: '/' + key });
+            }
+        }
+        if (ops.length === 0) {
+            return true;
+        }
+
+        const response = await fetch('/api/save-delta', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                playerUID: this.playerUID,
+                baseRevision: this.saveRevision,
+                ops: ops
+            })
+        });
+        if (!response.ok) {
+            return false;
+        }
+        const result = await response.json();
+        this.saveRevision = result.revision;
+        this.savedFields = fields;
+        return true;
+    }
+
     async loadProgress() {
         try {
-            const response = await fetch('/api/load-progress');
+            const response = await fetch('/api/load-progress?player_uid=' + encodeURIComponent(this.playerUID));
             if (response.ok) {
                 const saveData = await response.json();
                 if (saveData && saveData.playerName) {
                     this.restoreGameState(saveData);
+                    this.saveRevision = saveData.saveRevision || 0;
+                    this.savedFields = this.fieldSnapshot(saveData);
                     this.addLog("☁️ Progress loaded from cloud", 'success');
                     return true;
                 }
@@ -362,7 +429,8 @@ class WastelandSurvival {
         localStorage.removeItem(this.saveKey);
 
         // Clear cloud save
-        fetch('/api/clear-progress', { method: 'DELETE' }).catch(() => {});
+        this.savedFields = null;
+        fetch('/api/clear-progress?player_uid=' + encodeURIComponent(this.playerUID), { method: 'DELETE' }).catch(() => {});
     }
 
     updateStats() {
@@ -437,18 +505,22 @@ class WastelandSurvival {
 
     checkGameOver() {
         if (this.health <= 0) {
-            this.endGame("💀 You died from your injuries... The wasteland claims another soul.");
+            this.endGame("💀 You died from your injuries... The wasteland claims another soul.", 'injuries');
         } else if (this.food <= 0 && this.water <= 0) {
-            this.endGame("💀 You died of starvation and thirst... Your body becomes part of the wasteland.");
+            this.endGame("💀 You died of starvation and thirst... Your body becomes part of the wasteland.", 'starvation');
         } else if (this.radiation >= 100) {
-            this.endGame("☢️ Radiation poisoning has consumed you... You become one with the toxic earth.");
+            this.endGame("☢️ Radiation poisoning has consumed you... You become one with the toxic earth.", 'radiation');
         }
     }
 
-    endGame(message) {
+    endGame(message, cause) {
         this.gameOver = true;
         document.getElementById('death-message').textContent = message;
         document.getElementById('final-day-count').textContent = this.day;
+        document.getElementById('leaderboard-rank').textContent = '';
+
+        // Submit before resetProgress clears the name and day
+        this.submitRun(cause);
 
         // Reset progress on death
         this.resetProgress();
@@ -456,6 +528,30 @@ class WastelandSurvival {
         showScreen('game-over-screen');
     }
 
+    async submitRun(cause) {
+        try {
+            const response = await fetch('/api/submit-run', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    playerUID: this.playerUID,
+                    playerName: this.playerName,
+                    days: this.day,
+                    cause: cause
+                })
+            });
+            const result = await response.json();
+            if (result.success && result.rank) {
+                document.getElementById('leaderboard-rank').textContent =
+                    `🏆 #${result.rank} on the leaderboard!`;
+            }
+        } catch (error) {
+            // The leaderboard is optional; offline runs just aren't ranked
+        }
+    }
+
     randomChoice(array) {
         return array[Math.floor(Math.random() * array.length)];
     }
@@ -795,6 +891,22 @@ class WastelandSurvival {
         }
     }
 
+    async syncPremiumPurchases() {
+        // Purchases granted by the server (via Stripe webhooks) take effect
+        // even if this browser never saw the payment complete
+        try {
+            const response = await fetch('/api/entitlements?player_uid=' + encodeURIComponent(this.playerUID));
+            if (response.ok) {
+                const data = await response.json();
+                const purchases = data.entitlements[this.playerUID] || [];
+                purchases.forEach(item => this.premiumPurchases.add(item));
+                this.savePremiumPurchases();
+            }
+        } catch (error) {
+            console.log("Could not sync premium purchases");
+        }
+    }
+
     savePremiumPurchases() {
         try {
             localStorage.setItem('wasteland_premium_' + this.playerUID, 
@@ -1177,6 +1289,7 @@ async function startGame() {
 
     // Try to load existing progress
     const hasExistingProgress = await game.loadProgress();
+    await game.syncPremiumPurchases();
 
     if (!hasExistingProgress) {
         // New game
@@ -1258,6 +1371,60 @@ function checkBunkerSupplies() {
     game.updateStats();
 }
 
+// Encounter weights are shared with the Python engine through events.json
+const ENCOUNTER_HANDLERS = {
+    scavenge_location: () => scavengeLocation(),
+    mysterious_sound: () => mysteriousSound(),
+    supply_cache: () => supplyCache(),
+    radiation_storm: () => radiationStorm(),
+    creature_encounter: () => creatureEncounter()
+};
+
+class WeightedTable {
+    // Vose's alias method: O(1) weighted sampling after an O(n) build
+    constructor(values, weights) {
+        const n = values.length;
+        const total = weights.reduce((sum, weight) => sum + weight, 0);
+        const scaled = weights.map(weight => weight * n / total);
+        this.values = values;
+        this.prob = new Array(n).fill(1);
+        this.alias = values.map((_, index) => index);
+        const small = [], large = [];
+        scaled.forEach((p, index) => (p < 1 ? small : large).push(index));
+        while (small.length && large.length) {
+            const less = small.pop(), more = large.pop();
+            this.prob[less] = scaled[less];
+            this.alias[less] = more;
+            scaled[more] -= 1 - scaled[less];
+            (scaled[more] < 1 ? small : large).push(more);
+        }
+    }
+
+    sample() {
+        const column = Math.random() * this.values.length;
+        const index = Math.floor(column);
+        return column - index < this.prob[index] ? this.values[index] : this.values[this.alias[index]];
+    }
+}
+
+let encounterTable = new WeightedTable(Object.keys(ENCOUNTER_HANDLERS),
+                                       Object.keys(ENCOUNTER_HANDLERS).map(() => 1));
+
+async function loadEventTables() {
+    try {
+        const response = await fetch('/events.json');
+        if (response.ok) {
+            const tables = await response.json();
+            const names = Object.keys(tables.encounters).filter(name => name in ENCOUNTER_HANDLERS);
+            if (names.length) {
+                encounterTable = new WeightedTable(names, names.map(name => tables.encounters[name]));
+            }
+        }
+    } catch (error) {
+        console.log("Using default encounter weights");
+    }
+}
+
 function enterWasteland() {
     game.addLog("🌫️ You emerge into the toxic wasteland...", 'danger');
     game.addLog("The sky is a sickly yellow. Geiger counter clicks ominously.");
@@ -1268,31 +1435,9 @@ function enterWasteland() {
     game.addLog(`☢️ Radiation exposure: +${radiationGain}`, 'danger');
 
     // Random encounter
-    const encounters = [
-        'scavengeLocation', 'mysteriousSound', 'supplyCache', 
-        'radiationStorm', 'creatureEncounter'
-    ];
-    const encounter = game.randomChoice(encounters);
+    const encounter = encounterTable.sample();
 
-    setTimeout(() => {
-        switch(encounter) {
-            case 'scavengeLocation':
-                scavengeLocation();
-                break;
-            case 'mysteriousSound':
-                mysteriousSound();
-                break;
-            case 'supplyCache':
-                supplyCache();
-                break;
-            case 'radiationStorm':
-                radiationStorm();
-                break;
-            case 'creatureEncounter':
-                creatureEncounter();
-                break;
-        }
-    }, 1000);
+    setTimeout(ENCOUNTER_HANDLERS[encounter], 1000);
 
     game.updateStats();
 }
@@ -2241,4 +2386,5 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('name-selection').style.display = 'block';
     document.getElementById('game-content').style.display = 'none';
     showScreen('game-screen');
+    loadEventTables();
 });
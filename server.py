@@ -1,144 +1,805 @@
+import time
+
+# Taken before everything else is imported, for --profile-startup
+_IMPORTS_STARTED = time.perf_counter()
 
+import argparse
 import json
 import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import threading
-import time
-import stripe
-from payment_handler import PaymentProcessor
+import game_engine
+from save_codec import apply_patch, next_revision, validate_save
+from save_store import (
+    BACKENDS, InstrumentedSaveStore, migrate_legacy_save, open_save_store, valid_player_uid
+)
+from write_behind import WriteBehindBuffer
+from asset_cache import AssetCache
+from webhook_queue import WebhookQueue
+from entitlements import EntitlementStore
+from keepalive import Connection, IdleConnections
+from leaderboard import Leaderboard
+from metrics import NullRegistry, Registry
+from profiling import NullProfiler, Profiler, span
+from rate_limit import AdmissionController, TokenBucketLimiter, retry_after_header
+from request_body import BodyError, read_body
+from settings import load_settings
+from turns import TurnError, TurnService, client_save, public_save
+
+_IMPORTS_FINISHED = time.perf_counter()
+
+# Most player uids accepted by one batched entitlement lookup
+MAX_ENTITLEMENT_LOOKUP = 100
+# Most saves written by one /api/save-batch request
+MAX_BATCH_SAVES = 1000
+# Most saves returned by one /api/load-batch request, and how many are read
+# from the store per chunk of the streamed response
+MAX_BATCH_LOADS = 10000
+LOAD_BATCH_CHUNK = 200
+
+
+class SaveLocks:
+    """Per-player locks for the threads of one process.
+
+    Writes to one player's save are serialized so a delta is never applied
+    to a copy that a concurrent save is replacing.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, player_uid):
+        return self._locks[hash(player_uid) % len(self._locks)]
+
+    @contextmanager
+    def many(self, player_uids):
+        """Lock several players at once; stripes are taken in order, so no deadlock"""
+        stripes = sorted({hash(player_uid) % len(self._locks) for player_uid in player_uids})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            yield
+
+
+# URL path -> (file, content type) for the static game client
+STATIC_FILES = {
+    '/': ('index.html', 'text/html; charset=utf-8'),
+    '/style.css': ('style.css', 'text/css; charset=utf-8'),
+    '/script.js': ('script.js', 'text/javascript; charset=utf-8'),
+    '/events.json': ('events.json', 'application/json; charset=utf-8'),
+}
+
+# Paths reported as their own route in metrics; anything else is 'other'
+API_ROUTES = frozenset({
+    '/api/load-progress', '/api/save-progress', '/api/save-delta', '/api/clear-progress',
+    '/api/save-stats', '/api/entitlements', '/api/webhook-stats', '/api/create-payment',
+    '/api/verify-payment', '/api/webhook', '/api/submit-run', '/api/leaderboard', '/metrics',
+    '/readyz', '/api/save-batch', '/api/load-batch', '/api/action',
+})
+
+# Routes that write saves or call Stripe, and so are rate limited
+SAVE_ROUTES = frozenset({'/api/save-progress', '/api/save-delta', '/api/save-batch',
+                         '/api/action'})
+PAYMENT_ROUTES = frozenset({'/api/create-payment', '/api/verify-payment'})
+LIMITED_ROUTES = SAVE_ROUTES | PAYMENT_ROUTES | {'/api/submit-run'}
+
+
+class HTTPMetrics:
+    """The per-request metrics GameSaveHandler records"""
+
+    def __init__(self, registry):
+        self.requests = registry.counter(
+            'wasteland_http_requests_total', "Requests handled", ('route', 'method', 'status'))
+        self.duration = registry.histogram(
+            'wasteland_http_request_duration_seconds',
+            "Time from reading the request line to sending the response", ('route',))
+        self.in_flight = registry.gauge(
+            'wasteland_http_requests_in_flight', "Requests currently being handled", ('route',))
+        self.bytes_in = registry.counter(
+            'wasteland_http_request_bytes_total', "Request body bytes received", ('route',))
+        self.bytes_out = registry.counter(
+            'wasteland_http_response_bytes_total', "Response body bytes sent", ('route',))
+        self.rejected = registry.counter(
+            'wasteland_http_rejected_total', "Requests refused by rate limits or load shedding",
+            ('route', 'reason'))
+
+
+class LazyPaymentProcessor:
+    """Builds the PaymentProcessor, importing Stripe, on first use.
+
+    Importing stripe and requests is most of a cold start, and a process
+    that only serves saves and static files never needs them.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._processor = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._processor is not None
+
+    def get(self):
+        processor = self._processor
+        if processor is None:
+            with self._lock:
+                if self._processor is None:
+                    started = time.perf_counter()
+                    self._processor = self._factory()
+                    print(f"💳 Stripe client loaded in "
+                          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+                processor = self._processor
+        return processor
+
+    def process_event(self, event):
+        # Called by WebhookQueue workers
+        return self.get().process_event(event)
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase, for --profile-startup"""
+
+    def __init__(self):
+        self.phases = [('imports', _IMPORTS_FINISHED - _IMPORTS_STARTED)]
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def report(self):
+        lines = ["⏱️ Startup profile:"]
+        lines.extend(f"   {name:<16}{seconds * 1000:8.1f} ms" for name, seconds in self.phases)
+        lines.append(f"   {'total':<16}{self.total * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
 
 class GameSaveHandler(BaseHTTPRequestHandler):
-    SAVE_FILE = "wasteland_save.json"
-    
-    def __init__(self, *args, **kwargs):
-        self.payment_processor = PaymentProcessor()
-        super().__init__(*args, **kwargs)
-    
+    LEGACY_SAVE_FILE = "wasteland_save.json"
+
+    # HTTP/1.1 keeps connections open between requests, so every response
+    # must carry a Content-Length or be chunked.
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections are dropped after this many seconds so they
+    # don't pin a worker forever. Overridden from the command line.
+    timeout = 5
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # body waits on the client's delayed ACK on every keep-alive response.
+    disable_nagle_algorithm = True
+
+    @property
+    def payment_processor(self):
+        # Built once per process, on the first payment request, and shared
+        return self.server.payment_processor.get()
+
+    def handle(self):
+        # PooledHTTPServer holds the connection between requests, so each
+        # dispatch to a worker serves exactly one
+        self.close_connection = True
+        self.handle_one_request()
+
+    def handle_one_request(self):
+        self._started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._started is not None:
+                self.record_request()
+        # Once the server starts draining, finish the current request and
+        # hang up instead of waiting for the next one on this connection.
+        if getattr(self.server, 'draining', False):
+            self.close_connection = True
+
+    def parse_request(self):
+        # Timing starts once a request line has arrived, so idle keep-alive
+        # time isn't counted against the route
+        if not super().parse_request():
+            return False
+        if self.server.metrics.enabled:
+            self._route = self.route()
+            self._status = None
+            self._bytes_out = 0
+            self._bytes_in = 0
+            self._started = time.perf_counter()
+            self.server.http_metrics.in_flight.inc(self._route)
+        return True
+
+    def route(self):
+        """The request's path if it's a known route, otherwise 'other'"""
+        path = urlparse(self.path).path
+        return path if path in STATIC_FILES or path in API_ROUTES else 'other'
+
+    def record_request(self):
+        metrics = self.server.http_metrics
+        route = self._route
+        metrics.in_flight.dec(route)
+        metrics.duration.observe(time.perf_counter() - self._started, route)
+        # No status means the handler raised before it could respond
+        metrics.requests.inc(route, self.command, str(self._status or 'aborted'))
+        if self._bytes_in:
+            metrics.bytes_in.inc(route, amount=self._bytes_in)
+        if self._bytes_out:
+            metrics.bytes_out.inc(route, amount=self._bytes_out)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self._bytes_out = int(value)
+        super().send_header(keyword, value)
+
     def do_GET(self):
+        with self.server.profiler.sample(f"GET {self.route()}"):
+            self.route_get()
+
+    def do_POST(self):
+        with self.server.profiler.sample(f"POST {self.route()}"):
+            self.route_post()
+
+    def do_DELETE(self):
+        with self.server.profiler.sample(f"DELETE {self.route()}"):
+            self.route_delete()
+
+    def route_get(self):
         parsed_path = urlparse(self.path)
-        
+
         # Serve static files
-        if parsed_path.path == '/':
-            self.serve_file('index.html', 'text/html')
-        elif parsed_path.path == '/style.css':
-            self.serve_file('style.css', 'text/css')
-        elif parsed_path.path == '/script.js':
-            self.serve_file('script.js', 'text/javascript')
+        if parsed_path.path in STATIC_FILES:
+            self.serve_file(*STATIC_FILES[parsed_path.path])
         elif parsed_path.path == '/api/load-progress':
-            self.handle_load_progress()
+            self.handle_load_progress(parse_qs(parsed_path.query))
+        elif parsed_path.path == '/api/load-batch':
+            self.handle_load_batch(parse_qs(parsed_path.query).get('player_uid', []))
+        elif parsed_path.path == '/readyz':
+            self.handle_readyz()
+        elif parsed_path.path == '/api/leaderboard':
+            self.handle_leaderboard()
+        elif parsed_path.path == '/api/save-stats':
+            self.handle_save_stats()
+        elif parsed_path.path == '/metrics' and self.server.metrics.enabled:
+            self.handle_metrics()
+        elif parsed_path.path == '/api/entitlements':
+            self.handle_entitlements(parse_qs(parsed_path.query).get('player_uid', []))
+        elif parsed_path.path == '/api/webhook-stats':
+            self.handle_webhook_stats()
         elif parsed_path.path == '/api/create-payment':
-            self.handle_create_payment()
+            if self.admit(parsed_path.path):
+                self.handle_create_payment()
         elif parsed_path.path == '/api/verify-payment':
-            self.handle_verify_payment()
+            if self.admit(parsed_path.path):
+                self.handle_verify_payment()
         else:
             self.send_error(404)
-    
-    def do_POST(self):
+
+    def route_post(self):
+        if self.path in LIMITED_ROUTES and not self.admit(self.path):
+            return
         if self.path == '/api/save-progress':
             self.handle_save_progress()
+        elif self.path == '/api/save-delta':
+            self.handle_save_delta()
+        elif self.path == '/api/save-batch':
+            self.handle_save_batch()
+        elif self.path == '/api/action':
+            self.handle_action()
+        elif self.path == '/api/load-batch':
+            self.handle_load_batch_post()
         elif self.path == '/api/create-payment':
             self.handle_create_payment()
         elif self.path == '/api/verify-payment':
             self.handle_verify_payment()
+        elif self.path == '/api/submit-run':
+            self.handle_submit_run()
         elif self.path == '/api/webhook':
             self.handle_webhook()
+        elif self.path == '/api/entitlements':
+            self.handle_entitlements_batch()
         else:
+            # The body was never read, so the connection can't be reused
+            self.close_connection = True
             self.send_error(404)
-    
-    def do_DELETE(self):
-        if self.path == '/api/clear-progress':
-            self.handle_clear_progress()
+
+    def route_delete(self):
+        parsed_path = urlparse(self.path)
+
+        if parsed_path.path == '/api/clear-progress':
+            self.handle_clear_progress(parse_qs(parsed_path.query))
         else:
             self.send_error(404)
-    
+
+    def admit(self, path):
+        """Apply the per-IP limit and load shedding. False if the request was refused"""
+        server = self.server
+        if server.ip_limiter is not None:
+            wait = server.ip_limiter.acquire(self.client_address[0])
+            if wait:
+                self.reject(429, wait, path, 'ip_rate')
+                return False
+        if path in SAVE_ROUTES:
+            wait, reason = server.admission.admit_save(), 'save_backlog'
+        elif path == '/api/create-payment':
+            wait, reason = server.admission.admit_payment(), 'stripe_latency'
+        else:
+            wait = 0
+        if wait:
+            self.reject(503, wait, path, reason)
+            return False
+        return True
+
+    def player_rate_limited(self, limiter, player_uid):
+        """Refuse the request if player_uid is over its rate. Call after reading the body"""
+        if limiter is None:
+            return False
+        wait = limiter.acquire(player_uid)
+        if wait:
+            self.reject(429, wait, urlparse(self.path).path, 'player_rate', body_read=True)
+            return True
+        return False
+
+    def save_unstorable(self, save_data, **details):
+        """Answer 400 and return True if the store couldn't encode save_data"""
+        try:
+            validate_save(save_data)
+        except ValueError as e:
+            self.send_json(400, {"error": f"Invalid save: {e}", **details})
+            return True
+        return False
+
+    def reject(self, status, retry_after, route, reason, body_read=False):
+        self.server.http_metrics.rejected.inc(route, reason)
+        body = json.dumps({"error": "Too many requests" if status == 429 else "Server busy",
+                           "retry_after": retry_after_header(retry_after)}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Retry-After', retry_after_header(retry_after))
+        if not body_read:
+            # The unread body is still on the socket, so it can't be reused
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        """Read the request body within the route's size limit.
+
+        Returns a bytearray (empty if the request has no body), or None after
+        sending an error response.
+        """
+        server = self.server
+        path = urlparse(self.path).path
+        if path == '/api/save-batch':
+            max_size = server.max_batch_body
+        elif path in SAVE_ROUTES:
+            max_size = server.max_save_body
+        else:
+            max_size = server.max_body
+        try:
+            with span('read_body'):
+                body = read_body(self.rfile, self.headers, max_size,
+                                 server.body_timeout, self.connection)
+        except BodyError as e:
+            # The rest of the body is still on the socket, so hang up
+            self.send_json(e.status, {"error": str(e)}, close=True)
+            return None
+        if body is None:
+            if self.command == 'POST':
+                self.send_json(411, {"error": "Content-Length required"})
+                return None
+            body = bytearray()
+        self._bytes_in = len(body)
+        return body
+
+    def read_json(self):
+        """Read the body as a JSON object, or send a 4xx and return None"""
+        body = self.read_body()
+        if body is None:
+            return None
+        try:
+            # json.loads takes the bytes as they are; no decoded str copy
+            with span('json.decode'):
+                data = json.loads(body)
+        except ValueError as e:
+            self.send_json(400, {"error": f"Invalid JSON body: {e}"})
+            return None
+        if not isinstance(data, dict):
+            self.send_json(400, {"error": "Expected a JSON object"})
+            return None
+        return data
+
+    def send_json(self, status, payload, close=False):
+        """Send a JSON response with an explicit Content-Length"""
+        with span('json.encode'):
+            body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_ndjson(self, blocks):
+        """Stream a 200 response of newline-delimited JSON.
+
+        blocks yields bytes, each holding one or more complete lines, and is
+        only advanced as the previous block is sent. The body goes out with
+        chunked transfer encoding, or to connection close for HTTP/1.0.
+        """
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        sent = 0
+        for block in blocks:
+            if not block:
+                continue
+            sent += len(block)
+            self._bytes_out = sent
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(block), block))
+            else:
+                self.wfile.write(block)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
     def serve_file(self, filename, content_type):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
+            asset = self.server.asset_cache.get(filename, content_type)
         except FileNotFoundError:
             self.send_error(404)
-    
-    def handle_save_progress(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
-        try:
-            save_data = json.loads(post_data.decode('utf-8'))
-            
-            # Save to file
-            with open(self.SAVE_FILE, 'w') as f:
-                json.dump(save_data, f)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            return
+
+        encoding = asset.negotiate(self.headers.get('Accept-Encoding'))
+        not_modified = asset.not_modified(self.headers.get('If-None-Match'),
+                                          self.headers.get('If-Modified-Since'))
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', asset.etag_for(encoding))
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if not_modified:
             self.end_headers()
-            self.wfile.write(json.dumps({"status": "success"}).encode('utf-8'))
+            return
+
+        body = asset.bodies[encoding]
+        self.send_header('Content-type', asset.content_type)
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def player_uid_from_query(self, query):
+        """Return the player_uid query parameter, or None if it is unusable"""
+        player_uid = query.get('player_uid', [None])[0]
+        return player_uid if valid_player_uid(player_uid) else None
+
+    def handle_save_progress(self):
+        save_data = self.read_json()
+        if save_data is None:
+            return
+
+        try:
+            player_uid = save_data.get('playerUID')
+            if not valid_player_uid(player_uid):
+                self.send_json(400, {"error": "Missing or invalid playerUID"})
+                return
+            if self.player_rate_limited(self.server.save_limiter, player_uid):
+                return
+            if self.save_unstorable(save_data):
+                return
+
+            with self.server.save_lock(player_uid):
+                with span('save_store.get'):
+                    stored = self.server.save_store.get(player_uid)
+                # The server numbers revisions, so a delta's baseRevision
+                # always names a save this server stored
+                save_data = client_save(save_data, stored)
+                save_data['saveRevision'] = revision = next_revision(stored)
+                with span('save_store.put'):
+                    self.server.save_store.put(player_uid, save_data)
+                self.server.turns.discard(player_uid)
+
+            self.send_json(200, {"status": "success", "revision": revision})
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
-    
-    def handle_load_progress(self):
-        try:
-            if os.path.exists(self.SAVE_FILE):
-                with open(self.SAVE_FILE, 'r') as f:
-                    save_data = json.load(f)
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(save_data).encode('utf-8'))
+            self.send_json(500, {"error": str(e)})
+
+    def handle_save_delta(self):
+        """Apply JSON-patch style ops to the stored save.
+
+        The body is {"playerUID", "baseRevision", "ops": [...]}. The ops only
+        apply if the stored saveRevision still equals baseRevision; otherwise
+        the client gets a 409 and falls back to a full save.
+        """
+        delta = self.read_json()
+        if delta is None:
+            return
+
+        try:
+            player_uid = delta.get('playerUID')
+            base_revision = delta.get('baseRevision')
+            if not valid_player_uid(player_uid) or not isinstance(base_revision, int):
+                self.send_json(400, {"error": "Missing or invalid playerUID or baseRevision"})
+                return
+            if self.player_rate_limited(self.server.save_limiter, player_uid):
+                return
+
+            with self.server.save_lock(player_uid):
+                with span('save_store.get'):
+                    stored = self.server.save_store.get(player_uid)
+                if stored is None:
+                    self.send_json(404, {"error": "No save found"})
+                    return
+                revision = stored.get('saveRevision', 0)
+                if revision != base_revision:
+                    self.send_json(409, {"error": "Save has changed", "revision": revision})
+                    return
+                try:
+                    save_data = apply_patch(public_save(stored), delta.get('ops'))
+                except ValueError as e:
+                    self.send_json(400, {"error": f"Invalid delta: {e}"})
+                    return
+                if not isinstance(save_data, dict) or save_data.get('playerUID') != player_uid:
+                    self.send_json(400, {"error": "A delta can't change playerUID"})
+                    return
+                if self.save_unstorable(save_data):
+                    return
+                save_data = client_save(save_data, stored)
+                save_data['saveRevision'] = revision + 1
+                with span('save_store.put'):
+                    self.server.save_store.put(player_uid, save_data)
+                self.server.turns.discard(player_uid)
+
+            self.send_json(200, {"status": "success", "revision": revision + 1})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def handle_save_batch(self):
+        """Store many saves at once: {"saves": [save, ...]}.
+
+        Every save is checked before any is written, so an invalid save
+        rejects the whole batch. All of them are then written in one put_many
+        (see the README for what each backend guarantees if that fails). A
+        player listed twice keeps the later save.
+        """
+        request_data = self.read_json()
+        if request_data is None:
+            return
+        saves = request_data.get('saves')
+        if not isinstance(saves, list) or not 0 < len(saves) <= MAX_BATCH_SAVES:
+            self.send_json(400, {"error": f"Expected {{\"saves\": [...]}} with 1-{MAX_BATCH_SAVES} saves"})
+            return
+        batch = {}
+        for index, save_data in enumerate(saves):
+            player_uid = save_data.get('playerUID') if isinstance(save_data, dict) else None
+            if not valid_player_uid(player_uid):
+                self.send_json(400, {"error": "Missing or invalid playerUID", "index": index})
+                return
+            if self.save_unstorable(save_data, index=index):
+                return
+            batch[player_uid] = save_data
+
+        try:
+            with self.server.save_lock.many(batch):
+                with span('save_store.get_many'):
+                    stored = self.server.save_store.get_many(list(batch))
+                revisions = {}
+                for player_uid, save_data in batch.items():
+                    previous = stored.get(player_uid)
+                    save_data = batch[player_uid] = client_save(save_data, previous)
+                    save_data['saveRevision'] = revisions[player_uid] = next_revision(previous)
+                with span('save_store.put_many'):
+                    self.server.save_store.put_many(batch.items())
+                for player_uid in batch:
+                    self.server.turns.discard(player_uid)
+            self.send_json(200, {"status": "success", "saved": len(batch),
+                                 "revisions": revisions})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def handle_load_batch_post(self):
+        request_data = self.read_json()
+        if request_data is None:
+            return
+        player_uids = request_data.get('player_uids')
+        if not isinstance(player_uids, list):
+            self.send_json(400, {"error": "Expected {\"player_uids\": [...]}"})
+            return
+        self.handle_load_batch(player_uids)
+
+    def handle_load_batch(self, player_uids):
+        """Stream {"playerUID", "save"} lines, save null if there is none.
+
+        The store is read LOAD_BATCH_CHUNK players at a time, each chunk sent
+        before the next is read, so memory stays flat however many are asked
+        for. A failure once streaming has begun ends the stream with an
+        {"error"} line.
+        """
+        if not player_uids or len(player_uids) > MAX_BATCH_LOADS:
+            self.send_json(400, {"error": f"Pass 1-{MAX_BATCH_LOADS} player uids"})
+            return
+        if not all(valid_player_uid(player_uid) for player_uid in player_uids):
+            self.send_json(400, {"error": "Invalid player_uid"})
+            return
+        player_uids = list(dict.fromkeys(player_uids))
+
+        def blocks():
+            try:
+                for start in range(0, len(player_uids), LOAD_BATCH_CHUNK):
+                    chunk = player_uids[start:start + LOAD_BATCH_CHUNK]
+                    with span('save_store.get_many'):
+                        saves = self.server.save_store.get_many(chunk)
+                    with span('json.encode'):
+                        yield b''.join(
+                            json.dumps({"playerUID": player_uid,
+                                        "save": public_save(saves.get(player_uid))}
+                                       ).encode('utf-8') + b'\n'
+                            for player_uid in chunk)
+            except Exception as e:
+                yield json.dumps({"error": str(e)}).encode('utf-8') + b'\n'
+
+        self.send_ndjson(blocks())
+
+    def handle_action(self):
+        """Play a turn on the server: {"playerUID", "choice"}.
+
+        choice answers the pending decision; {"restart": true} (optionally
+        with "playerName") starts a new game; with neither the whole state is
+        returned. The answer carries the events, the changed state fields
+        and the next decision (see turns.TurnService).
+        """
+        action = self.read_json()
+        if action is None:
+            return
+        player_uid = action.get('playerUID')
+        choice = action.get('choice')
+        player_name = action.get('playerName')
+        if not valid_player_uid(player_uid):
+            self.send_json(400, {"error": "Missing or invalid playerUID"})
+            return
+        if choice is not None and not isinstance(choice, str):
+            self.send_json(400, {"error": "choice must be a string"})
+            return
+        if player_name is not None and not isinstance(player_name, str):
+            self.send_json(400, {"error": "playerName must be a string"})
+            return
+
+        try:
+            result = self.server.turns.act(player_uid, choice, bool(action.get('restart')),
+                                           player_name)
+            self.send_json(200, {"success": True, **result})
+        except TurnError as e:
+            self.send_json(e.status, {"success": False, "error": str(e), **e.details})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def handle_load_progress(self, query):
+        player_uid = self.player_uid_from_query(query)
+        if player_uid is None:
+            self.send_json(400, {"error": "Missing or invalid player_uid"})
+            return
+
+        try:
+            with span('save_store.get'):
+                save_data = self.server.save_store.get(player_uid)
+            if save_data is not None:
+                self.send_json(200, public_save(save_data))
             else:
-                self.send_response(404)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "No save found"}).encode('utf-8'))
+                self.send_json(404, {"error": "No save found"})
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
-    
-    def handle_clear_progress(self):
-        try:
-            if os.path.exists(self.SAVE_FILE):
-                os.remove(self.SAVE_FILE)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "cleared"}).encode('utf-8'))
+            self.send_json(500, {"error": str(e)})
+
+    def handle_clear_progress(self, query):
+        player_uid = self.player_uid_from_query(query)
+        if player_uid is None:
+            self.send_json(400, {"error": "Missing or invalid player_uid"})
+            return
+
+        try:
+            with self.server.save_lock(player_uid), span('save_store.delete'):
+                self.server.save_store.delete(player_uid)
+                self.server.turns.discard(player_uid)
+
+            self.send_json(200, {"status": "cleared"})
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
-    
+            self.send_json(500, {"error": str(e)})
+
+    def handle_submit_run(self):
+        """Record a finished run: {"playerUID", "playerName", "days", "cause"}"""
+        run = self.read_json()
+        if run is None:
+            return
+        player_uid = run.get('playerUID')
+        if not valid_player_uid(player_uid):
+            self.send_json(400, {"error": "Missing or invalid playerUID"})
+            return
+        if self.player_rate_limited(self.server.save_limiter, player_uid):
+            return
+
+        try:
+            rank = self.server.leaderboard.record(player_uid, run)
+        except ValueError as e:
+            self.send_json(400, {"success": False, "error": str(e)})
+            return
+        self.send_json(200, {"success": True, "rank": rank})
+
+    def handle_leaderboard(self):
+        body = self.server.leaderboard.snapshot()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'max-age=5')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_save_stats(self):
+        save_store = self.server.save_store
+        if isinstance(save_store, WriteBehindBuffer):
+            self.send_json(200, {"write_behind": True, **save_store.stats()})
+        else:
+            self.send_json(200, {"write_behind": False})
+
+    def handle_readyz(self):
+        """200 once startup has warmed the caches, 503 before that and while draining"""
+        server = self.server
+        if not server.ready or server.draining:
+            self.send_json(503, {"ready": False, "draining": server.draining})
+            return
+        self.send_json(200, {"ready": True,
+                             "startup_ms": round(server.startup_profile.total * 1000, 1),
+                             "payments_loaded": server.payment_processor.loaded})
+
+    def handle_metrics(self):
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def handle_create_payment(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
+        request_data = self.read_json()
+        if request_data is None:
+            return
+
         try:
-            request_data = json.loads(post_data.decode('utf-8'))
             item_type = request_data.get('item_type')
             player_uid = request_data.get('player_uid')
-            
+            if (valid_player_uid(player_uid)
+                    and self.player_rate_limited(self.server.payment_limiter, player_uid)):
+                return
+
             # Define prices (in cents)
             prices = {
                 'starter_pack': 100,  # $1.00
                 'premium_bundle': 299,  # $2.99
                 'mega_pack': 499  # $4.99
             }
-            
+
             amount = prices.get(item_type, 100)
-            
+
             result = self.payment_processor.create_payment_intent(
                 amount_cents=amount,
                 metadata={
@@ -146,60 +807,452 @@ class GameSaveHandler(BaseHTTPRequestHandler):
                     'item_type': item_type
                 }
             )
-            
-            self.send_response(200 if result['success'] else 400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode('utf-8'))
-            
+
+            self.send_json(200 if result['success'] else 400, result)
+
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
-    
+            self.send_json(500, {"error": str(e)})
+
     def handle_verify_payment(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
+        request_data = self.read_json()
+        if request_data is None:
+            return
+
         try:
-            request_data = json.loads(post_data.decode('utf-8'))
             payment_intent_id = request_data.get('payment_intent_id')
-            
+
             result = self.payment_processor.verify_payment(payment_intent_id)
-            
-            self.send_response(200 if result['success'] else 400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode('utf-8'))
-            
+
+            self.send_json(200 if result['success'] else 400, result)
+
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
-    
+            self.send_json(500, {"error": str(e)})
+
     def handle_webhook(self):
-        content_length = int(self.headers['Content-Length'])
-        payload = self.rfile.read(content_length)
+        body = self.read_body()
+        if body is None:
+            return
+        # Signature checks need the exact bytes Stripe sent
+        payload = bytes(body)
         sig_header = self.headers.get('Stripe-Signature')
-        
+
         try:
-            result = self.payment_processor.handle_webhook(payload, sig_header)
-            
-            self.send_response(200 if result['success'] else 400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode('utf-8'))
-            
+            webhook_queue = self.server.webhook_queue
+            if webhook_queue is None:
+                result = self.payment_processor.handle_webhook(payload, sig_header)
+                self.send_json(200 if result['success'] else 400, result)
+                return
+
+            # Verify now, apply later: Stripe only needs to know we have it
+            try:
+                event = self.payment_processor.construct_event(payload, sig_header)
+            except ValueError as e:
+                self.send_json(400, {'success': False, 'error': str(e)})
+                return
+
+            queued = webhook_queue.enqueue(event['id'], event['type'], payload.decode('utf-8'))
+            self.send_json(200, {'success': True, 'queued': queued})
+
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
+            self.send_json(500, {"error": str(e)})
+
+    def handle_entitlements(self, player_uids):
+        if not player_uids or len(player_uids) > MAX_ENTITLEMENT_LOOKUP:
+            self.send_json(400, {"error": f"Pass 1-{MAX_ENTITLEMENT_LOOKUP} player_uid values"})
+            return
+        if not all(valid_player_uid(player_uid) for player_uid in player_uids):
+            self.send_json(400, {"error": "Invalid player_uid"})
+            return
+
+        try:
+            entitlements = self.server.entitlement_store.get_many(player_uids)
+            self.send_json(200, {"entitlements": entitlements})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def handle_entitlements_batch(self):
+        request_data = self.read_json()
+        if request_data is None:
+            return
+        player_uids = request_data.get('player_uids')
+        if not isinstance(player_uids, list):
+            self.send_json(400, {"error": "Expected {\"player_uids\": [...]}"})
+            return
+        self.handle_entitlements(player_uids)
+
+    def handle_webhook_stats(self):
+        webhook_queue = self.server.webhook_queue
+        if webhook_queue is None:
+            self.send_json(200, {"queued": False})
+        else:
+            self.send_json(200, {"queued": True, **webhook_queue.stats()})
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that serves requests from a bounded worker pool.
+
+    A worker only holds a connection while it has a whole request to serve.
+    Until then, and between keep-alive requests, the connection waits in
+    IdleConnections, so idle or slow clients can't occupy the pool. Ready
+    requests queue for a free worker.
+
+    At most max_connections are open at once. Past that, the longest-idle
+    connection is closed to make room. If none is idle, the accept loop
+    blocks and excess connections wait in the listen backlog.
+    """
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=16, drain_timeout=10.0,
+                 reuse_port=False, max_connections=1000, idle_timeout=5.0):
+        # SO_REUSEPORT lets pre-forked workers all bind the same port
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self.max_connections = max_connections
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self._open = 0  # accepted and not yet closed
+        self._active = 0  # with a worker, or queued for one
+        self._changed = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='wasteland-worker')
+        self._idle = IdleConnections(self._dispatch, self._close_connection, idle_timeout)
+
+    def process_request(self, request, client_address):
+        with self._changed:
+            while self._open >= self.max_connections:
+                self._idle.evict_oldest()
+                self._changed.wait(0.1)
+            self._open += 1
+        self._idle.park(Connection(request, client_address))
+
+    def _dispatch(self, connection):
+        with self._changed:
+            self._active += 1
+        try:
+            self._executor.submit(self._serve, connection)
+        except RuntimeError:
+            # Pool already shut down
+            self._finish(connection, keep=False)
+
+    def _serve(self, connection):
+        keep = False
+        try:
+            handler = self.RequestHandlerClass(connection, connection.address, self)
+            keep = not handler.close_connection and not self.draining
+        except Exception:
+            self.handle_error(connection, connection.address)
+        self._finish(connection, keep)
+
+    def _finish(self, connection, keep):
+        with self._changed:
+            self._active -= 1
+            self._changed.notify_all()
+        if keep:
+            connection.served = True
+            self._idle.park(connection)
+        else:
+            self._close_connection(connection)
+
+    def _close_connection(self, connection):
+        self.shutdown_request(connection)
+        with self._changed:
+            self._open -= 1
+            self._changed.notify_all()
+
+    def drain(self):
+        """Finish in-flight requests and close every connection, up to drain_timeout"""
+        self.draining = True
+        # Connections between requests close now; new ones get to send theirs
+        self._idle.drain()
+        deadline = time.monotonic() + self.drain_timeout
+        with self._changed:
+            while self._open > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            drained = self._active == 0
+        self._idle.close()
+        self._executor.shutdown(wait=drained, cancel_futures=True)
+        return drained
+
+    def accept_backlog(self):
+        """Serve the connections already queued on the listening socket.
+
+        With SO_REUSEPORT each connection is assigned to one worker's socket
+        as it arrives, and closing that socket resets the ones still queued
+        instead of handing them to a sibling.
+        """
+        self.socket.setblocking(False)
+        while True:
+            try:
+                request, client_address = self.get_request()
+            except OSError:
+                return
+            self.process_request(request, client_address)
+
+    def server_close(self):
+        if self.allow_reuse_port:
+            self.accept_backlog()
+        self.drain()
+        super().server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Wasteland cloud save server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=16,
+                        help="threads serving requests (per process); idle keep-alive "
+                             "connections don't occupy one")
+    parser.add_argument('--max-connections', type=int, default=1000,
+                        help="open connections per process; past this the longest-idle "
+                             "one is closed")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="server processes sharing the port; more than 1 starts "
+                             "a supervisor that pre-forks them")
+    parser.add_argument('--lock-file', default='wasteland_players.lock',
+                        help="file whose byte-range locks serialize a player's saves "
+                             "across processes")
+    parser.add_argument('--worker-index', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--keepalive-timeout', type=float, default=5.0,
+                        help="seconds an idle keep-alive connection is held open")
+    parser.add_argument('--drain-timeout', type=float, default=10.0,
+                        help="seconds to wait for in-flight requests on shutdown")
+    parser.add_argument('--save-backend', choices=sorted(BACKENDS), default='files',
+                        help="where player saves are stored")
+    parser.add_argument('--save-path', default=None,
+                        help="save directory (files) or database file (sqlite)")
+    parser.add_argument('--save-window', type=float, default=1.0,
+                        help="seconds saves are buffered and coalesced before "
+                             "being written; 0 writes every save immediately")
+    parser.add_argument('--save-batch', type=int, default=500,
+                        help="flush early once this many players have pending saves")
+    parser.add_argument('--webhook-workers', type=int, default=2,
+                        help="threads applying queued webhook events; "
+                             "0 applies them inline in the webhook request")
+    parser.add_argument('--webhook-db', default='wasteland_webhooks.db',
+                        help="database holding the webhook queue")
+    parser.add_argument('--entitlements-db', default='wasteland_entitlements.db',
+                        help="database holding premium purchases")
+    parser.add_argument('--leaderboard-file', default='wasteland_leaderboard.json',
+                        help="where the leaderboard and run statistics are kept")
+    parser.add_argument('--leaderboard-size', type=int, default=100,
+                        help="number of top runs kept on the leaderboard")
+    parser.add_argument('--ip-rate', type=float, default=20.0,
+                        help="save, run and payment requests per second per client IP (0 = no limit)")
+    parser.add_argument('--ip-burst', type=int, default=60)
+    parser.add_argument('--save-rate', type=float, default=2.0,
+                        help="saves per second per player (0 = no limit)")
+    parser.add_argument('--save-burst', type=int, default=10)
+    parser.add_argument('--payment-rate', type=float, default=0.1,
+                        help="payment intents per second per player (0 = no limit)")
+    parser.add_argument('--payment-burst', type=int, default=5)
+    parser.add_argument('--turn-sessions', type=int, default=10000,
+                        help="games kept in memory for /api/action (0 = load every turn)")
+    parser.add_argument('--max-pending-saves', type=int, default=20000,
+                        help="shed saves with 503 while more than this many await writing")
+    parser.add_argument('--stripe-latency-limit', type=float, default=3.0,
+                        help="shed new payments with 503 while Stripe averages slower "
+                             "than this many seconds (0 = never)")
+    parser.add_argument('--max-body', type=int, default=64 * 1024,
+                        help="largest request body accepted, in bytes (saves excepted)")
+    parser.add_argument('--max-save-body', type=int, default=1024 * 1024,
+                        help="largest save or save delta body accepted, in bytes")
+    parser.add_argument('--max-batch-body', type=int, default=32 * 1024 * 1024,
+                        help="largest /api/save-batch body accepted, in bytes")
+    parser.add_argument('--body-timeout', type=float, default=10.0,
+                        help="seconds a client gets to send a whole request body")
+    parser.add_argument('--profile-rate', type=float, default=0.0,
+                        help="fraction of requests run under cProfile with timing spans "
+                             "(0 = off); SIGUSR1 writes the results to --profile-dir")
+    parser.add_argument('--profile-dir', default='profiles',
+                        help="where sampled request profiles are written")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print how long each startup phase took")
+    parser.add_argument('--no-metrics', dest='metrics', action='store_false',
+                        help="disable request, Stripe and save timing metrics and /metrics")
+    return parser.parse_args(argv)
+
+
+def migrate_legacy_data(args):
+    """Import the save and purchase files older versions kept"""
+    save_store = open_save_store(args.save_backend, args.save_path)
+    try:
+        migrated_uid = migrate_legacy_save(save_store, GameSaveHandler.LEGACY_SAVE_FILE)
+    finally:
+        save_store.close()
+    if migrated_uid:
+        print(f"📦 Migrated {GameSaveHandler.LEGACY_SAVE_FILE} to player {migrated_uid}")
+    entitlement_store = EntitlementStore(args.entitlements_db)
+    try:
+        imported = entitlement_store.import_legacy_files()
+    finally:
+        entitlement_store.close()
+    if imported:
+        print(f"📦 Imported {imported} premium_*.json files into {args.entitlements_db}")
+
+
+def supervise(args, argv):
+    """Run args.processes pre-forked workers under a supervisor"""
+    from prefork import Supervisor
+
+    migrate_legacy_data(args)
+    print(f"🚀 Wasteland server running on http://{args.host}:{args.port}")
+    print(f"⚙️ {args.processes} processes, each serving up to {args.workers} requests at once")
+    if args.save_window > 0:
+        print("💾 Write-behind is off across processes; workers write saves through")
+    Supervisor([sys.executable, os.path.abspath(__file__), *argv],
+               args.processes, args.drain_timeout).run()
+
+
+def attach_services(server, args, settings, worker):
+    """Open the stores and build the services handlers reach through server"""
+    save_store = open_save_store(args.save_backend, args.save_path)
+    if args.metrics:
+        # Under the write-behind buffer, so this times the real I/O
+        save_store = InstrumentedSaveStore(save_store, server.metrics)
+    # A buffered save would be invisible to the other workers, and could
+    # land on disk after a newer save one of them wrote
+    if args.save_window > 0 and not worker:
+        save_store = WriteBehindBuffer(save_store, window=args.save_window,
+                                       max_batch=args.save_batch)
+    server.save_store = save_store
+    if worker:
+        from prefork import PlayerFileLocks
+        server.save_lock = PlayerFileLocks(args.lock_file)
+    else:
+        server.save_lock = SaveLocks()
+    server.ip_limiter = TokenBucketLimiter(args.ip_rate, args.ip_burst) if args.ip_rate else None
+    server.save_limiter = (TokenBucketLimiter(args.save_rate, args.save_burst)
+                           if args.save_rate else None)
+    server.payment_limiter = (TokenBucketLimiter(args.payment_rate, args.payment_burst)
+                              if args.payment_rate else None)
+    server.admission = AdmissionController(
+        save_backlog=save_store.backlog if isinstance(save_store, WriteBehindBuffer) else None,
+        max_pending_saves=args.max_pending_saves,
+        stripe_latency_limit=args.stripe_latency_limit,
+    )
+    # Cached games would go stale when another worker plays the same player
+    server.turns = TurnService(save_store, server.save_lock,
+                               max_sessions=0 if worker else args.turn_sessions)
+    if server.profiler.enabled:
+        # Engine calls become spans of a sampled /api/action request, and
+        # are sampled on their own like main.py's
+        game_engine.set_turn_hook(server.profiler.sample)
+    server.leaderboard = Leaderboard(args.leaderboard_file, top_k=args.leaderboard_size)
+    server.asset_cache = AssetCache(os.path.dirname(os.path.abspath(__file__)))
+    server.entitlement_store = EntitlementStore(args.entitlements_db, shared=worker)
+
+    def build_payment_processor():
+        from payment_handler import create_payment_processor
+        return create_payment_processor(
+            settings, server.entitlement_store, metrics=server.metrics,
+            latency_observer=server.admission.record_stripe_latency)
+
+    server.payment_processor = LazyPaymentProcessor(build_payment_processor)
+    server.webhook_queue = None
+    if args.webhook_workers > 0:
+        server.webhook_queue = WebhookQueue(server.payment_processor, args.webhook_db,
+                                            workers=args.webhook_workers)
+
+
+def run(args):
+    # A pre-forked worker shares the port, the stores and each player's
+    # saves with its siblings
+    worker = args.worker_index is not None
+    profile = StartupProfile()
+    with profile.phase('settings'):
+        settings = load_settings()
+    if not worker:
+        with profile.phase('migrations'):
+            migrate_legacy_data(args)
+    GameSaveHandler.timeout = args.keepalive_timeout
+    with profile.phase('bind'):
+        server = PooledHTTPServer((args.host, args.port), GameSaveHandler,
+                                  max_workers=args.workers,
+                                  drain_timeout=args.drain_timeout,
+                                  reuse_port=worker,
+                                  max_connections=args.max_connections,
+                                  idle_timeout=args.keepalive_timeout)
+    server.ready = False
+    server.startup_profile = profile
+    server.metrics = Registry() if args.metrics else NullRegistry()
+    server.http_metrics = HTTPMetrics(server.metrics)
+    server.profiler = (Profiler(args.profile_dir, args.profile_rate) if args.profile_rate > 0
+                       else NullProfiler())
+    server.max_body = args.max_body
+    server.max_save_body = args.max_save_body
+    server.max_batch_body = args.max_batch_body
+    server.body_timeout = args.body_timeout
+    with profile.phase('stores'):
+        attach_services(server, args, settings, worker)
+
+    def request_shutdown(signum, frame):
+        print("\n🛑 Shutting down, draining in-flight requests...")
+        server.draining = True
+        # shutdown() blocks until serve_forever returns, so it can't run
+        # on the thread that is inside serve_forever.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def dump_profile():
+        for path in server.profiler.dump():
+            print(f"📊 Profile written to {path}")
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    if server.profiler.enabled:
+        # Written on a thread; the signal may arrive mid-request
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: threading.Thread(target=dump_profile).start())
+
+    if worker:
+        from prefork import signal_ready, watch_parent
+        watch_parent(lambda: request_shutdown(signal.SIGTERM, None))
+    else:
+        print(f"🚀 Wasteland server running on http://{args.host}:{args.port}")
+        print(f"⚙️ Serving up to {args.workers} requests concurrently")
+        print(f"☢️ Cloud save system active! ({args.save_backend} backend)")
+        if args.metrics:
+            print("📈 Metrics at /metrics")
+
+    def warm_up():
+        # The server already accepts connections; /readyz (and, for a
+        # pre-forked worker, the supervisor) waits until this is done
+        with profile.phase('warm caches'):
+            server.asset_cache.preload(STATIC_FILES.values())
+            server.leaderboard.snapshot()
+        server.ready = True
+        if worker:
+            signal_ready(args.ready_fd)
+        if args.profile_startup:
+            print(profile.report())
+
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if server.webhook_queue is not None:
+            server.webhook_queue.close()
+        server.entitlement_store.close()
+        server.leaderboard.close()
+        game_engine.set_turn_hook(None)
+        dump_profile()
+        # Closing the write-behind buffer flushes every pending save
+        server.save_store.close()
+        if isinstance(server.save_store, WriteBehindBuffer):
+            stats = server.save_store.stats()
+            print(f"💾 Saves: {stats['received']} received, {stats['coalesced']} coalesced, "
+                  f"{stats['persisted']} persisted in {stats['batches']} batches")
+        print("👋 Server stopped.")
+
 
 if __name__ == '__main__':
-    server = HTTPServer(('0.0.0.0', 5000), GameSaveHandler)
-    print("🚀 Wasteland server running on http://0.0.0.0:5000")
-    print("☢️ Cloud save system active!")
-    server.serve_forever()
+    args = parse_args()
+    if args.processes > 1 and args.worker_index is None:
+        supervise(args, sys.argv[1:])
+    else:
+        run(args)
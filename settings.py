@@ -0,0 +1,46 @@
+"""Server configuration read from the environment.
+
+``load_settings`` reads the environment, plus a ``.env`` file if python-dotenv
+is installed, exactly once at startup into an immutable ``Settings``. Nothing
+else reads os.environ, so every module sees the same values and importing a
+module never has configuration side effects.
+"""
+import collections
+import os
+
+Settings = collections.namedtuple('Settings', [
+    'stripe_secret_key',
+    'stripe_webhook_secret',
+    'stripe_api_base',
+    'stripe_timeout',
+    'stripe_max_retries',
+    'stripe_pool_size',
+    'stripe_verify_pending_ttl',
+])
+
+
+def load_settings(environ=None, dotenv_path=None):
+    """Build Settings from environ (default os.environ) and a .env file.
+
+    Without dotenv_path, python-dotenv looks for .env beside this module and
+    in its parent directories. Variables already in the environment win
+    over the .env file.
+    """
+    values = {}
+    try:
+        from dotenv import dotenv_values
+    except ImportError:
+        pass
+    else:
+        values.update((key, value) for key, value in dotenv_values(dotenv_path).items()
+                      if value is not None)
+    values.update(os.environ if environ is None else environ)
+    return Settings(
+        stripe_secret_key=values.get('STRIPE_SECRET_KEY'),
+        stripe_webhook_secret=values.get('STRIPE_WEBHOOK_SECRET'),
+        stripe_api_base=values.get('STRIPE_API_BASE') or None,
+        stripe_timeout=float(values.get('STRIPE_TIMEOUT', '10')),
+        stripe_max_retries=int(values.get('STRIPE_MAX_RETRIES', '2')),
+        stripe_pool_size=int(values.get('STRIPE_POOL_SIZE', '16')),
+        stripe_verify_pending_ttl=float(values.get('STRIPE_VERIFY_PENDING_TTL', '2')),
+    )
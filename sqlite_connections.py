@@ -0,0 +1,37 @@
+"""Per-thread SQLite connections.
+
+sqlite3 connections can't be shared between threads, so every SQLite-backed
+store hands each worker thread its own connection to the same database file.
+"""
+import sqlite3
+import threading
+
+
+class ThreadLocalConnections:
+    """Open one autocommit WAL-mode connection per thread on demand"""
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
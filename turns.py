@@ -0,0 +1,252 @@
+"""Server-authoritative turns.
+
+``TurnService`` plays the game_engine rules (the ones main.py uses) on the
+server, one choice at a time, for /api/action. Clients send a choice and get
+back the events it caused, the fields of their state that changed and the
+next decision. They never send state, and they never see or steer the dice.
+
+Every player's game lives in the save store, merged into the browser save
+(``GameState.to_dict`` covers the shared fields). The engine's own fields go
+under an ``engine`` key: the pending decision, and a seed plus a step count
+from which each action's dice are rolled. A game therefore reloads exactly
+where it left off, in any process.
+
+Recently active games stay parsed in a bounded LRU, so a turn costs no store
+read and no GameState rebuild. The resulting save is handed to
+``save_store.put``. Behind the write-behind buffer that is a dict assignment,
+and a player's many turns per second coalesce into one disk write.
+
+The engine key is the server's alone. ``public_save`` strips it from saves
+sent to clients, so they can't predict the dice. ``client_save`` applies to
+every save a client writes: it drops an ``engine`` key the client sent, and
+once the server is playing a game it keeps the server's value of every
+field the engine owns. Clients can still store everything else in their save.
+
+A cached game is only valid while nothing else writes the player's save.
+Handlers that do write it call ``discard`` under the player's save lock, so
+the next action reloads.
+"""
+import random
+import secrets
+import threading
+from collections import OrderedDict
+
+import game_engine
+from game_engine import Decision, GameState
+from profiling import span
+from save_codec import next_revision
+
+
+# Save fields only the engine may write in a game the server plays. The
+# player's name isn't game state, so clients may still change it.
+ENGINE_FIELDS = ('engine',) + tuple(key for key in GameState().to_dict() if key != 'playerName')
+
+
+class TurnError(Exception):
+    """The action can't be played; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class _Session:
+    __slots__ = ('save', 'state', 'seed', 'step')
+
+    def __init__(self, save, state, seed, step):
+        self.save = save  # the stored save this game was loaded from or wrote last
+        self.state = state
+        self.seed = seed
+        self.step = step
+
+
+def _new_seed():
+    return secrets.randbits(64)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _load_session(player_uid, save):
+    if not isinstance(save, dict):
+        return _Session({'playerUID': player_uid}, game_engine.new_game(), _new_seed(), 0)
+    state = GameState.from_dict(save)
+    engine = save.get('engine')
+    if (not isinstance(engine, dict) or not _is_int(engine.get('seed'))
+            or not _is_int(engine.get('step', 0))):
+        # A save from the browser game; the server takes it from here
+        return _Session(save, state, _new_seed(), 0)
+    pending = engine.get('pending')
+    if (isinstance(pending, dict) and pending.get('name') in game_engine.DECISION_HANDLERS
+            and isinstance(pending.get('options'), list)):
+        state.pending = Decision(pending['name'], pending['options'])
+    state.game_over = bool(engine.get('gameOver'))
+    cause = engine.get('cause')
+    state.cause = cause if isinstance(cause, str) else None
+    return _Session(save, state, engine['seed'], engine.get('step', 0))
+
+
+def public_save(save):
+    """save as clients may see it: without the engine's seed and dice"""
+    if isinstance(save, dict) and 'engine' in save:
+        save = dict(save)
+        del save['engine']
+    return save
+
+
+def client_save(save, stored):
+    """The save to store when a client writes save over stored.
+
+    A client never writes the engine key. If stored is a game the server
+    plays, its engine fields are kept and the client's are ignored.
+    """
+    save = public_save(save)
+    if isinstance(stored, dict) and isinstance(stored.get('engine'), dict):
+        save = dict(save)
+        for key in ENGINE_FIELDS:
+            if key in stored:
+                save[key] = stored[key]
+            else:
+                save.pop(key, None)
+    return save
+
+
+def event_dict(event):
+    """An engine Event as JSON: {"kind", ...its data}"""
+    return {'kind': event.kind, **event.data}
+
+
+def pending_dict(state):
+    if state.pending is None:
+        return None
+    return {'name': state.pending.name, 'options': list(state.pending.options)}
+
+
+class TurnService:
+    """Resolves players' choices with the rules engine"""
+
+    def __init__(self, save_store, save_lock, max_sessions=10000):
+        # save_lock(player_uid) is the lock every writer of that player's
+        # save holds; max_sessions=0 reloads the game on every action
+        self.save_store = save_store
+        self.save_lock = save_lock
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'actions': 0, 'hits': 0, 'misses': 0}
+
+    def act(self, player_uid, choice=None, restart=False, player_name=None):
+        """Play one action for player_uid and return what happened.
+
+        choice answers the pending decision. restart begins a new game, named
+        player_name if given. With neither, nothing is played and every field
+        of the state comes back, which is how a client picks a game up.
+        Raises TurnError for a choice the game can't take.
+        """
+        with self.save_lock(player_uid):
+            session = self._session(player_uid)
+            try:
+                return self._act(player_uid, session, choice, restart, player_name)
+            except TurnError:
+                raise
+            except Exception:
+                # The store may not hold what the cached game does
+                self.discard(player_uid)
+                raise
+
+    def _act(self, player_uid, session, choice, restart, player_name):
+        state = session.state
+        before = state.to_dict()
+        seed, step = session.seed, session.step
+        if restart:
+            state = game_engine.new_game(player_name or state.player_name)
+            seed, step = _new_seed(), 0
+        # Each action rolls its own dice from the seed, so a reloaded game
+        # rolls exactly what the cached one would have
+        rng = random.Random(seed + step)
+        events = []
+        played = restart
+        if state.pending is None and not state.game_over:
+            # A new game, or a browser save the server hasn't played yet
+            state, turn_events = game_engine.start_turn(state, rng)
+            events.extend(turn_events)
+            played = True
+        if choice is not None and not restart:
+            if state.game_over:
+                raise TurnError(409, "The game is over", cause=state.cause)
+            if choice not in state.pending.options:
+                raise TurnError(400, f"Invalid choice {choice!r}",
+                                options=list(state.pending.options))
+            state, step_events = game_engine.step(state, choice, rng)
+            events.extend(step_events)
+            if state.pending is None and not state.game_over:
+                state, turn_events = game_engine.start_turn(state, rng)
+                events.extend(turn_events)
+            played = True
+
+        if played:
+            session.state, session.seed, session.step = state, seed, step + 1
+            self._persist(player_uid, session)
+        after = state.to_dict()
+        if choice is not None and not restart:
+            changes = {key: value for key, value in after.items() if before[key] != value}
+        else:
+            changes = after
+        with self._lock:
+            self._counters['actions'] += 1
+        return {
+            'revision': session.save.get('saveRevision', 0),
+            'changes': changes,
+            'events': [event_dict(event) for event in events],
+            'pending': pending_dict(state),
+            'gameOver': state.game_over,
+            'cause': state.cause,
+        }
+
+    def _session(self, player_uid):
+        # Caller holds save_lock(player_uid), so only this thread can load
+        # or replace the player's session
+        with self._lock:
+            session = self._sessions.get(player_uid)
+            if session is not None:
+                self._sessions.move_to_end(player_uid)
+                self._counters['hits'] += 1
+                return session
+            self._counters['misses'] += 1
+        with span('save_store.get'):
+            session = _load_session(player_uid, self.save_store.get(player_uid))
+        if self.max_sessions:
+            with self._lock:
+                self._sessions[player_uid] = session
+                while len(self._sessions) > self.max_sessions:
+                    # Every action is already in the store, so eviction is free
+                    self._sessions.popitem(last=False)
+        return session
+
+    def _persist(self, player_uid, session):
+        state = session.state
+        save = dict(session.save)
+        save.update(state.to_dict())
+        save['playerUID'] = player_uid
+        save['saveRevision'] = next_revision(session.save)
+        save['engine'] = {
+            'seed': session.seed,
+            'step': session.step,
+            'pending': pending_dict(state),
+            'gameOver': state.game_over,
+            'cause': state.cause,
+        }
+        with span('save_store.put'):
+            self.save_store.put(player_uid, save)
+        session.save = save
+
+    def discard(self, player_uid):
+        """Forget the cached game. Call holding save_lock(player_uid) when writing its save"""
+        with self._lock:
+            self._sessions.pop(player_uid, None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'sessions': len(self._sessions)}
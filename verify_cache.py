@@ -0,0 +1,128 @@
+"""Cache of payment intent verification results.
+
+Clients poll /api/verify-payment after checkout, and each poll used to be a
+live PaymentIntent.retrieve. Results are now cached by payment intent id:
+
+* terminal statuses (succeeded, canceled) never change, so they are kept until
+  evicted by the LRU bound;
+* other statuses are kept for a short TTL;
+* concurrent lookups of the same id share a single upstream call;
+* payment_intent webhooks fill the cache, so most verifications after a
+  successful payment never reach Stripe at all.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+TERMINAL_STATUSES = frozenset({'succeeded', 'canceled'})
+
+
+def verification_result(status):
+    """The verify_payment response for a payment intent status"""
+    return {
+        'success': True,
+        'status': status,
+        'paid': status == 'succeeded'
+    }
+
+
+class _Call:
+    """An upstream lookup that other threads can wait on"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class VerificationCache:
+    """TTL/LRU cache with single-flight lookups"""
+
+    def __init__(self, pending_ttl=2.0, max_entries=50000):
+        self.pending_ttl = pending_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # intent id -> (result, expires_at or None)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'collapsed': 0, 'webhook_updates': 0}
+
+    def _lookup(self, intent_id, now):
+        # Caller holds self._lock
+        entry = self._entries.get(intent_id)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[intent_id]
+            return None
+        self._entries.move_to_end(intent_id)
+        return result
+
+    def _store(self, intent_id, result):
+        """Cache result unless a terminal status is cached; returns what is cached"""
+        # Caller holds self._lock
+        current = self._lookup(intent_id, time.monotonic())
+        if current is not None and current['status'] in TERMINAL_STATUSES:
+            # A terminal status is final; a fetch or webhook that started
+            # before it arrived must not replace it
+            return current
+        if result['status'] in TERMINAL_STATUSES:
+            expires_at = None
+        else:
+            expires_at = time.monotonic() + self.pending_ttl
+        self._entries[intent_id] = (result, expires_at)
+        self._entries.move_to_end(intent_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return result
+
+    def get_or_fetch(self, intent_id, fetch):
+        """Return the cached result for intent_id, calling fetch(intent_id) on a miss"""
+        with self._lock:
+            result = self._lookup(intent_id, time.monotonic())
+            if result is not None:
+                self._counters['hits'] += 1
+                return result
+            call = self._calls.get(intent_id)
+            leader = call is None
+            if leader:
+                call = self._calls[intent_id] = _Call()
+                self._counters['misses'] += 1
+            else:
+                self._counters['collapsed'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = fetch(intent_id)
+            # Only successful lookups are cached; errors are retried next time
+            if result.get('success'):
+                with self._lock:
+                    result = self._store(intent_id, result)
+            call.result = result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[intent_id]
+            call.done.set()
+
+    def record(self, intent_id, status):
+        """Update the cache from a payment_intent webhook"""
+        with self._lock:
+            result = verification_result(status)
+            if self._store(intent_id, result) is result:
+                self._counters['webhook_updates'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        return stats
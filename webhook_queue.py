@@ -0,0 +1,217 @@
+"""Durable queue for Stripe webhook events.
+
+The webhook endpoint only verifies the signature and enqueues the raw event,
+so Stripe gets its 200 without waiting on entitlement writes. A small pool of
+worker threads drains the queue in the background.
+
+Stripe delivers events at least once and retries deliveries it thinks failed,
+so every event id that has been applied is recorded in an idempotency index
+and later deliveries of the same id are dropped.
+
+Events are claimed with a lease rather than deleted up front: if a worker
+dies mid-event, the lease expires and the event is picked up again.
+"""
+import json
+import threading
+import time
+
+from sqlite_connections import ThreadLocalConnections
+
+# Stripe retries for up to three days; keep processed ids a while longer
+PROCESSED_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+class WebhookQueue:
+    """SQLite-backed event queue with an idempotency index"""
+
+    def __init__(self, processor, path='wasteland_webhooks.db', workers=2,
+                 lease_seconds=60, max_attempts=8, retry_delay=2.0):
+        self.processor = processor
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._connections = ThreadLocalConnections(path)
+        self._wakeup = threading.Condition()
+        self._closed = False
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'duplicates': 0,
+            'processed': 0,
+            'retried': 0,
+            'dead': 0,
+        }
+
+        conn = self._connections.get()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " event_id TEXT PRIMARY KEY,"
+            " event_type TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " received_at REAL NOT NULL,"
+            " available_at REAL NOT NULL,"
+            " claimed_until REAL NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " dead INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT"
+            ");"
+            "CREATE INDEX IF NOT EXISTS events_ready ON events (dead, available_at);"
+            "CREATE TABLE IF NOT EXISTS processed_events ("
+            " event_id TEXT PRIMARY KEY,"
+            " processed_at REAL NOT NULL"
+            ") WITHOUT ROWID;"
+        )
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f'webhook-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def enqueue(self, event_id, event_type, payload):
+        """Durably queue a verified event. Returns False for a duplicate"""
+        now = time.time()
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seen = conn.execute(
+                "SELECT 1 FROM processed_events WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            inserted = False
+            if not seen:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO events"
+                    " (event_id, event_type, payload, received_at, available_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (event_id, event_type, payload, now, now),
+                )
+                inserted = cursor.rowcount > 0
+        if not inserted:
+            self._count('duplicates')
+            return False
+        self._count('enqueued')
+        with self._wakeup:
+            self._wakeup.notify()
+        return True
+
+    def _claim(self):
+        """Lease the oldest ready event. Returns (event_id, payload, attempts) or None"""
+        now = time.time()
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT event_id, payload, attempts FROM events"
+                " WHERE dead = 0 AND available_at <= ? AND claimed_until <= ?"
+                " ORDER BY available_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE events SET claimed_until = ?, attempts = attempts + 1"
+                " WHERE event_id = ?",
+                (now + self.lease_seconds, row[0]),
+            )
+        return row
+
+    def _complete(self, event_id):
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM events WHERE event_id = ?", (event_id,))
+            conn.execute(
+                "INSERT OR IGNORE INTO processed_events (event_id, processed_at) VALUES (?, ?)",
+                (event_id, time.time()),
+            )
+        self._count('processed')
+
+    def _fail(self, event_id, attempts, error):
+        dead = attempts >= self.max_attempts
+        # Exponential backoff between attempts
+        delay = self.retry_delay * (2 ** (attempts - 1))
+        conn = self._connections.get()
+        with conn:
+            conn.execute(
+                "UPDATE events SET available_at = ?, claimed_until = 0, dead = ?, last_error = ?"
+                " WHERE event_id = ?",
+                (time.time() + delay, int(dead), error, event_id),
+            )
+        self._count('dead' if dead else 'retried')
+        print(f"Error processing webhook {event_id} (attempt {attempts}): {error}")
+
+    def _process(self, event_id, payload, attempts):
+        try:
+            already_done = self._connections.get().execute(
+                "SELECT 1 FROM processed_events WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            if not already_done:
+                result = self.processor.process_event(json.loads(payload))
+                if not result.get('success'):
+                    raise RuntimeError(result.get('error', 'event processing failed'))
+        except Exception as e:
+            self._fail(event_id, attempts, str(e))
+            return
+        self._complete(event_id)
+
+    def _work(self):
+        last_prune = 0.0
+        while not self._closed:
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                print(f"Error reading webhook queue: {e}")
+                claimed = None
+            if claimed is not None:
+                event_id, payload, attempts = claimed
+                try:
+                    self._process(event_id, payload, attempts + 1)
+                except Exception as e:
+                    # Recording the outcome failed; the lease runs out and
+                    # the event is claimed again
+                    print(f"Error updating webhook queue for {event_id}: {e}")
+                continue
+            if time.time() - last_prune > 3600:
+                last_prune = time.time()
+                try:
+                    self._prune()
+                except Exception as e:
+                    print(f"Error pruning webhook queue: {e}")
+            with self._wakeup:
+                if not self._closed:
+                    # Wake up periodically to pick up retries that came due
+                    self._wakeup.wait(1.0)
+
+    def _prune(self):
+        cutoff = time.time() - PROCESSED_RETENTION_SECONDS
+        conn = self._connections.get()
+        with conn:
+            conn.execute("DELETE FROM processed_events WHERE processed_at < ?", (cutoff,))
+
+    def stats(self):
+        """Queue depth, lag of the oldest waiting event, and counters"""
+        depth, oldest, dead = self._connections.get().execute(
+            "SELECT SUM(dead = 0), MIN(CASE WHEN dead = 0 THEN received_at END), SUM(dead)"
+            " FROM events"
+        ).fetchone()
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['depth'] = depth or 0
+        stats['dead_letters'] = dead or 0
+        stats['lag_seconds'] = round(time.time() - oldest, 3) if oldest is not None else 0.0
+        return stats
+
+    def close(self):
+        """Stop the workers after their current event"""
+        self._closed = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._connections.close_all()
@@ -0,0 +1,197 @@
+"""Write-behind buffering for player saves.
+
+The web client posts its whole state after nearly every action, so most saves
+are overwritten again within seconds. ``WriteBehindBuffer`` sits in front of a
+``SaveStore``: a save is recorded in memory and acknowledged immediately, and a
+background thread persists the latest save per player in batches. Saves that
+arrive for the same player before their batch is written replace the pending
+one instead of costing another disk write.
+"""
+import threading
+import time
+
+from save_store import STORE_ERRORS, SaveStore
+
+# Marks a pending delete in the buffer
+_DELETED = object()
+
+
+class WriteBehindBuffer(SaveStore):
+    """Coalesce saves per player and flush them to a store in batches"""
+
+    def __init__(self, store, window=1.0, max_batch=500):
+        self.store = store
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        # The batch currently being written, so reads never fall into the gap
+        # between leaving _pending and landing in the store.
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._counters = {
+            'received': 0,     # saves and deletes accepted from clients
+            'coalesced': 0,    # replaced a pending write before it hit disk
+            'persisted': 0,    # saves actually written to the store
+            'deleted': 0,      # deletes applied to the store
+            'batches': 0,      # flushes that wrote at least one change
+            'errors': 0,       # failed flushes (retried), and saves the store refused
+        }
+        self._thread = threading.Thread(target=self._run, name='save-write-behind',
+                                        daemon=True)
+        self._thread.start()
+
+    def get(self, player_uid):
+        with self._lock:
+            for layer in (self._pending, self._in_flight):
+                if player_uid in layer:
+                    save_data = layer[player_uid]
+                    return None if save_data is _DELETED else save_data
+        return self.store.get(player_uid)
+
+    def get_many(self, player_uids):
+        result = {}
+        missing = []
+        with self._lock:
+            for player_uid in player_uids:
+                for layer in (self._pending, self._in_flight):
+                    if player_uid in layer:
+                        save_data = layer[player_uid]
+                        result[player_uid] = None if save_data is _DELETED else save_data
+                        break
+                else:
+                    missing.append(player_uid)
+        if missing:
+            result.update(self.store.get_many(missing))
+        return result
+
+    def put(self, player_uid, save_data):
+        self._record(player_uid, save_data)
+
+    def put_many(self, items):
+        # Recorded under one lock so the whole batch lands in the same flush
+        # and reaches the store in a single put_many
+        with self._lock:
+            for player_uid, save_data in items:
+                self._record_locked(player_uid, save_data)
+
+    def delete(self, player_uid):
+        self._record(player_uid, _DELETED)
+        return True
+
+    def _record(self, player_uid, save_data):
+        with self._lock:
+            self._record_locked(player_uid, save_data)
+
+    def _record_locked(self, player_uid, save_data):
+        # Caller holds self._lock
+        if self._closed:
+            raise RuntimeError("write-behind buffer is closed")
+        self._counters['received'] += 1
+        if player_uid in self._pending:
+            self._counters['coalesced'] += 1
+        self._pending[player_uid] = save_data
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.notify()
+
+    def stats(self):
+        """Return a snapshot of the buffer's counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def backlog(self):
+        """Saves accepted but not yet written, including the batch being written"""
+        # len() of a dict is atomic, so this skips the lock on the hot path
+        return len(self._pending) + len(self._in_flight)
+
+    def flush(self):
+        """Write everything pending right now, on the calling thread"""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._write_batch(batch)
+
+    def _take_batch(self):
+        # Caller holds self._lock
+        batch = self._pending
+        self._pending = {}
+        self._in_flight = batch
+        return batch
+
+    def _write_batch(self, batch):
+        saves = [(uid, data) for uid, data in batch.items() if data is not _DELETED]
+        deletes = [uid for uid, data in batch.items() if data is _DELETED]
+        refused = set()
+        try:
+            if saves:
+                try:
+                    self.store.put_many(saves)
+                except STORE_ERRORS:
+                    raise
+                except Exception as e:
+                    # A single save the store can't take fails the whole
+                    # batch; write them one by one so it can't hold back the rest
+                    print(f"Error flushing saves, writing them one at a time: {e}")
+                    self._put_each(saves, refused)
+            for player_uid in deletes:
+                self.store.delete(player_uid)
+        except Exception as e:
+            print(f"Error flushing saves: {e}")
+            with self._lock:
+                self._counters['errors'] += 1 + len(refused)
+                # Put the batch back unless a newer write has superseded it
+                for player_uid, save_data in batch.items():
+                    if player_uid not in refused:
+                        self._pending.setdefault(player_uid, save_data)
+                self._in_flight = {}
+            return False
+        with self._lock:
+            self._counters['persisted'] += len(saves) - len(refused)
+            self._counters['errors'] += len(refused)
+            self._counters['deleted'] += len(deletes)
+            self._counters['batches'] += 1
+            self._in_flight = {}
+        return True
+
+    def _put_each(self, saves, refused):
+        # Saves the store refuses are dropped, their uids added to refused.
+        # A store error stops the pass, and the batch is retried.
+        for player_uid, save_data in saves:
+            try:
+                self.store.put(player_uid, save_data)
+            except STORE_ERRORS:
+                raise
+            except Exception as e:
+                print(f"Dropping save for {player_uid}, the store refused it: {e}")
+                refused.add(player_uid)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.window
+                while not self._closed and len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                closed = self._closed
+                batch = self._take_batch()
+            if batch and not self._write_batch(batch) and not closed:
+                # Back off a little before retrying a failing store
+                time.sleep(self.window)
+            if closed:
+                return
+
+    def close(self):
+        """Stop the flusher after writing everything still pending"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        if self._pending:
+            # The final flush failed; make one last attempt before giving up
+            self.flush()
+        self.store.close()